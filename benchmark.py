@@ -0,0 +1,172 @@
+import argparse
+import json
+import os
+import pickle
+import platform
+import sys
+import tempfile
+import time
+import timeit
+import tracemalloc
+
+from tictactoe.agent import Qlearner, SARSAlearner
+from tictactoe.bitboard import BitGame
+from tictactoe.game import Game, getStateKey
+from tictactoe.teacher import PerfectTeacher, Teacher
+from play import GameLearning, addCommonArguments
+
+
+# Boards used by the game and teacher benchmarks: a mid-game position with
+# no winner, so that every check scans the whole board.
+BOARD = [['X', 'O', '-'], ['-', 'X', '-'], ['O', '-', '-']]
+STATE = getStateKey(BOARD)
+NEXT_STATE = 'XO-OX-O--'
+
+
+def makeGame(game_class):
+    game = game_class(None, teacher=Teacher())
+    for i, row in enumerate(BOARD):
+        for j, elt in enumerate(row):
+            if elt != '-':
+                game.placeToken((i, j), elt)
+    return game
+
+
+def trainedAgent(learner=Qlearner, backend='dict', episodes=2000):
+    """ An agent with a populated Q-table, trained against the teacher. """
+    agent = learner(0.5, 0.9, 0.1, backend=backend, rng=0)
+    teacher = Teacher(rng=0)
+    for _ in range(episodes):
+        Game(agent, teacher=teacher).start()
+    return agent
+
+
+def benchmarks(episodes):
+    """
+    Return a dict of benchmark name -> (function, number of operations per
+    call). Setup work (e.g. training the agents) happens here, outside of
+    the timed functions.
+    """
+    cases = {}
+    for name, game_class in (('game', Game), ('bitgame', BitGame)):
+        game = makeGame(game_class)
+        cases['%s.checkForWin' % name] = (lambda g=game: g.checkForWin('X'), 1)
+        cases['%s.checkForDraw' % name] = (game.checkForDraw, 1)
+        cases['%s.checkForEnd' % name] = (lambda g=game: g.checkForEnd('X'), 1)
+        cases['%s.stateKey' % name] = (game.stateKey, 1)
+    cases['getStateKey'] = (lambda: getStateKey(BOARD), 1)
+
+    for backend in ('dict', 'dense'):
+        for learner in (Qlearner, SARSAlearner):
+            agent = trainedAgent(learner, backend)
+            agent.rewards = []
+            prefix = '%s[%s]' % (learner.__name__, backend)
+            if learner is Qlearner:
+                greedy = trainedAgent(learner, backend)
+                greedy.eps = 0.
+                explore = trainedAgent(learner, backend)
+                explore.eps = 1.
+                cases['%s.get_action(eps=0)' % prefix] = (
+                    lambda a=greedy: a.get_action(STATE), 1)
+                cases['%s.get_action(eps=1)' % prefix] = (
+                    lambda a=explore: a.get_action(STATE), 1)
+            cases['%s.update' % prefix] = (
+                lambda a=agent: a.update(STATE, NEXT_STATE, (0, 2), (1, 2), 0), 1)
+            cases['%s.update(terminal)' % prefix] = (
+                lambda a=agent: a.update(STATE, None, (0, 2), None, 1), 1)
+
+    for teacher in (Teacher(rng=0), PerfectTeacher(rng=0)):
+        cases['%s.makeMove' % type(teacher).__name__] = (
+            lambda t=teacher: t.makeMove(BOARD), 1)
+
+    tmpdir = tempfile.mkdtemp()
+    parser = argparse.ArgumentParser()
+    addCommonArguments(parser)
+
+    def teach(extra=()):
+        path = os.path.join(tmpdir, 'agent.pkl')
+        if os.path.exists(path):
+            os.remove(path)
+        args = parser.parse_args(['-p', path, *extra])
+        args.seed = 0
+        gl = GameLearning(args, interactive=False)
+        gl.beginTeaching(episodes, report_every=None)
+
+    cases['beginTeaching(episodes)'] = (teach, episodes)
+    cases['beginTeaching(episodes, bitboard)'] = (
+        lambda: teach(['--bitboard']), episodes)
+
+    agent = trainedAgent()
+    path = os.path.join(tmpdir, 'trained.pkl')
+    agent.save(path)
+
+    def load():
+        with open(path, 'rb') as f:
+            pickle.load(f)
+
+    cases['Learner.save'] = (lambda: agent.save(path), 1)
+    cases['Learner.load'] = (load, 1)
+    return cases
+
+
+def measure(fn, ops, min_time):
+    """
+    Time 'fn' and trace its memory use. Returns ops/sec (best of 5 repeats,
+    each lasting at least 'min_time' seconds) and peak traced memory of a
+    single call in bytes.
+    """
+    timer = timeit.Timer(fn)
+    number, _ = timer.autorange()
+    number = max(1, int(number*min_time/0.2))
+    best = min(timer.repeat(repeat=5, number=number))
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {'ops_per_sec': ops*number/best, 'peak_bytes': peak}
+
+
+def compare(results, baseline):
+    """ Print the speed ratio of each benchmark against a baseline run. """
+    print('\n%-45s %10s' % ('benchmark', 'speedup'))
+    for name, res in results['benchmarks'].items():
+        base = baseline['benchmarks'].get(name)
+        if base is not None:
+            print('%-45s %9.2fx' % (name, res['ops_per_sec']/base['ops_per_sec']))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the game engine, "
+                                     "agents and teacher.")
+    parser.add_argument("-o", "--output", type=str, default=None,
+                        help="write the results to this JSON file")
+    parser.add_argument("-c", "--compare", type=str, default=None,
+                        help="JSON results of an earlier run to compare with")
+    parser.add_argument("-k", "--filter", type=str, default=None,
+                        help="only run benchmarks whose name contains FILTER")
+    parser.add_argument("--episodes", type=int, default=500,
+                        help="episodes per end-to-end training run")
+    parser.add_argument("--min_time", type=float, default=0.2,
+                        help="minimum seconds per timing repeat")
+    args = parser.parse_args()
+
+    results = {
+        'python': sys.version.split()[0],
+        'platform': platform.platform(),
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'benchmarks': {},
+    }
+    print('%-45s %14s %12s' % ('benchmark', 'ops/sec', 'peak bytes'))
+    for name, (fn, ops) in benchmarks(args.episodes).items():
+        if args.filter is not None and args.filter not in name:
+            continue
+        res = measure(fn, ops, args.min_time)
+        results['benchmarks'][name] = res
+        print('%-45s %14.1f %12i' % (name, res['ops_per_sec'], res['peak_bytes']))
+
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.compare is not None:
+        with open(args.compare) as f:
+            compare(results, json.load(f))
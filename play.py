@@ -1,11 +1,24 @@
 import argparse
 import os
-import pickle
 import sys
 
-from tictactoe.agent import Qlearner, SARSAlearner
-from tictactoe.teacher import Teacher
+# Only modules that are cheap to import are loaded here. Those that need
+# NumPy, asyncio or multiprocessing are imported where they are used, so
+# that the interactive game starts quickly.
+from tictactoe.agent import (TRACE_KINDS, QLambdalearner, Qlearner,
+                             ReplayQlearner, SARSALambdalearner, SARSAlearner,
+                             TraceLearner)
+from tictactoe.teacher import PerfectTeacher, Teacher
 from tictactoe.game import Game
+from tictactoe.bitboard import BitGame
+from tictactoe.parallel import MERGE_POLICIES, ParallelTrainer
+from tictactoe.qtable import EVICTION_POLICIES, DenseQTable
+from tictactoe.symmetry import SymmetricQTable
+from tictactoe.metrics import EpisodeLog
+from tictactoe.rng import makeStream, spawnSeeds
+from tictactoe.players import LearnerPlayer, TeacherPlayer
+from tictactoe.evaluate import (BOARD_ACTIONS, DEFAULT_OPPONENTS, evaluate,
+                                formatResults, loadBoardAgent)
 
 
 class GameLearning(object):
@@ -13,19 +26,33 @@ class GameLearning(object):
     A class that holds the state of the learning process. Learning
     agents are created/loaded here, and a count is kept of the
     games that have been played.
+
+    When 'interactive' is False, nothing is ever read from stdin: an
+    existing agent file is only overwritten if args.force is set.
     """
-    def __init__(self, args, alpha=0.5, gamma=0.9, epsilon=0.1):
+    def __init__(self, args, alpha=0.5, gamma=0.9, epsilon=0.1, eps_decay=0.,
+                 interactive=True):
 
+        from tictactoe.checkpoint import loadAgent
+        # independent random streams for the agent and the teacher
+        seed = getattr(args, 'seed', None)
+        seeds = spawnSeeds(seed, 2)
         if args.load:
             # load an existing agent and continue training
             if not os.path.isfile(args.path):
                 raise ValueError("Cannot load agent: file does not exist.")
-            with open(args.path, 'rb') as f:
-                agent = pickle.load(f)
+            agent = loadAgent(args.path)
+            if seed is not None:
+                agent.rng = makeStream(seeds[0])
+            checkLoadedAgent(agent, args)
         else:
             # check if agent state file already exists, and ask
             # user whether to overwrite if so
-            if os.path.isfile(args.path):
+            if os.path.isfile(args.path) and not interactive:
+                if not args.force:
+                    raise ValueError("An agent is already saved at {}. Use "
+                                     "--force to overwrite.".format(args.path))
+            elif os.path.isfile(args.path):
                 print('An agent is already saved at {}.'.format(args.path))
                 while True:
                     response = input("Are you sure you want to overwrite? [y/n]: ")
@@ -36,57 +63,268 @@ class GameLearning(object):
                         sys.exit(0)
                     else:
                         print("Invalid input. Please choose 'y' or 'n'.")
-            if args.agent_type == "q":
-                agent = Qlearner(alpha,gamma,epsilon)
-            else:
-                agent = SARSAlearner(alpha,gamma,epsilon)
+            learner = Qlearner if args.agent_type == "q" else SARSAlearner
+            kwargs = {}
+            if args.lam is not None:
+                learner = lambdaLearner(args.agent_type)
+                kwargs = dict(lam=args.lam, trace=args.trace)
+            if args.replay is not None:
+                learner = ReplayQlearner
+                kwargs = dict(capacity=args.replay, batch_size=args.replay_batch,
+                              replay_every=args.replay_every,
+                              passes=args.replay_passes,
+                              prioritized=args.prioritized)
+            agent = learner(alpha, gamma, epsilon, eps_decay,
+                            backend=args.qtable, symmetric=args.symmetric,
+                            reward_capacity=args.reward_capacity,
+                            max_states=args.max_states, eviction=args.eviction,
+                            rng=seeds[0], **kwargs)
+        if args.episode_log is not None:
+            agent.episode_log = EpisodeLog(args.episode_log)
 
         self.games_played = 0
         self.path = args.path
         self.agent = agent
+        self.game_class = BitGame if args.bitboard else Game
+        self.teacher_class = PerfectTeacher if args.perfect else Teacher
+        self.teacher_level = args.teacher_level
+        self.teacher_seed = seeds[1]
+        # a self-play opponent with its own Q-table is saved alongside
+        self.opponent = None
+        self.opponent_path = None
+
+    def save(self):
+        """ Save the agent, and the self-play opponent if it has a path. """
+        from tictactoe.checkpoint import saveAgent
+        saveAgent(self.agent, self.path)
+        if self.opponent_path is not None:
+            saveAgent(self.opponent, self.opponent_path)
 
     def beginPlaying(self):
         """ Loop through game iterations with a human player. """
+        from tictactoe.checkpoint import IncrementalCheckpointer
         print("Welcome to Tic-Tac-Toe. You are 'X' and the computer is 'O'.")
 
-        def play_again():
-            print("Games played: %i" % self.games_played)
+        # binary checkpoints of dense agents are saved incrementally: each
+        # game only appends the changed Q values to a write-ahead log
+        checkpointer = None
+        if self.path.endswith('.ckpt') and isinstance(
+                getattr(self.agent.Q, 'table', self.agent.Q), DenseQTable):
+            checkpointer = IncrementalCheckpointer(self.agent, self.path)
+        try:
             while True:
-                play = input("Do you want to play again? [y/n]: ")
-                if play == 'y' or play == 'yes':
-                    return True
-                elif play == 'n' or play == 'no':
-                    return False
+                game = self.game_class(self.agent)
+                game.start()
+                self.games_played += 1
+                if checkpointer is not None:
+                    checkpointer.commit()
                 else:
-                    print("Invalid input. Please choose 'y' or 'n'.")
-
-        while True:
-            game = Game(self.agent)
-            game.start()
-            self.games_played += 1
-            self.agent.save(self.path)
-            if not play_again():
-                print("OK. Quitting.")
-                break
-
-    def beginTeaching(self, episodes):
-        """ Loop through game iterations with a teaching agent. """
-        teacher = Teacher()
-        # Train for alotted number of episodes
+                    self.save()
+                if not askPlayAgain(self.games_played):
+                    print("OK. Quitting.")
+                    break
+        finally:
+            if checkpointer is not None:
+                checkpointer.close()
+
+    def teach(self, play, episodes, report_every, checkpoint_every):
+        """
+        Train for the alloted number of episodes by calling play(n), which
+        plays n games and returns the number played. Games are played in
+        chunks that end on multiples of 'report_every' (progress is printed)
+        and 'checkpoint_every' (the agent is saved); either may be None.
+        """
+        intervals = [i for i in (report_every, checkpoint_every) if i]
         while self.games_played < episodes:
-            game = Game(self.agent, teacher=teacher)
-            game.start()
-            self.games_played += 1
+            n = episodes - self.games_played
+            for interval in intervals:
+                n = min(n, interval - self.games_played % interval)
+            self.games_played += play(n)
             # Monitor progress
-            if self.games_played % 1000 == 0:
+            if report_every and self.games_played % report_every == 0:
                 print("Games played: %i" % self.games_played)
+            if checkpoint_every and self.games_played % checkpoint_every == 0:
+                self.save()
         # save final agent
-        self.agent.save(self.path)
+        self.save()
 
+    def beginTeaching(self, episodes, report_every=1000, checkpoint_every=None,
+                      instrument=None):
+        """
+        Loop through game iterations with a teaching agent. If an
+        Instrumentation is given, the games report their timings and
+        results to it.
+        """
+        player = TeacherPlayer(self.teacher_class(self.teacher_level,
+                                                  rng=self.teacher_seed))
+        game_class = self.game_class
+        if instrument is not None:
+            from tictactoe.instrument import instrumentedGameClass
+            game_class = instrumentedGameClass(game_class, instrument)
 
-if __name__ == "__main__":
-    # Parse command line arguments
-    parser = argparse.ArgumentParser(description="Play Tic-Tac-Toe.")
+        def play(n):
+            for _ in range(n):
+                game = game_class(self.agent, player=player)
+                game.start()
+            return n
+
+        self.teach(play, episodes, report_every, checkpoint_every)
+
+    def beginBatchTeaching(self, episodes, batch_size, seed=None,
+                           report_every=1000, checkpoint_every=None):
+        """ Train with a teaching agent, playing many games in lockstep. """
+        from tictactoe.batch import BatchTrainer
+        if not isinstance(self.agent.Q, DenseQTable):
+            # batched training needs the array-backed Q-table
+            self.agent.Q = DenseQTable.fromTable(self.agent.Q)
+        trainer = BatchTrainer(self.agent, self.teacher_class(self.teacher_level),
+                               batch_size, seed)
+        self.teach(trainer.train, episodes, report_every, checkpoint_every)
+
+    def beginParallelTeaching(self, episodes, workers, sync_interval, merge,
+                              seed=None, report_every=1000,
+                              checkpoint_every=None):
+        """ Train with a teaching agent in several worker processes. """
+        if not isinstance(self.agent.Q, DenseQTable):
+            # workers share the array-backed Q-table
+            self.agent.Q = DenseQTable.fromTable(self.agent.Q)
+        trainer = ParallelTrainer(self.agent,
+                                  self.teacher_class(self.teacher_level),
+                                  workers, sync_interval, merge,
+                                  self.game_class, seed)
+        # each call forks the workers; report only when they are done
+        self.teach(trainer.train, episodes, None, checkpoint_every)
+        if report_every:
+            print("Games played: %i" % self.games_played)
+
+
+    def beginSelfPlay(self, episodes, opponent, opponent_path=None,
+                      batch_size=None, seed=None, report_every=1000,
+                      checkpoint_every=None):
+        """
+        Train the agent against a second learner playing 'X' instead of the
+        teacher (see selfplay.mirrorLearner). Both learn from every game. An
+        opponent with its own Q-table is saved to 'opponent_path' along
+        with the agent. With a batch size, the games are played in lockstep.
+        """
+        self.opponent = opponent
+        self.opponent_path = opponent_path
+        if batch_size is not None:
+            from tictactoe.selfplay import SelfPlayTrainer
+            # batched training needs the array-backed Q-table
+            shared = opponent.Q is self.agent.Q
+            if not isinstance(self.agent.Q, DenseQTable):
+                self.agent.Q = DenseQTable.fromTable(self.agent.Q)
+            if shared:
+                opponent.Q = self.agent.Q
+            elif not isinstance(opponent.Q, DenseQTable):
+                opponent.Q = DenseQTable.fromTable(opponent.Q)
+            play = SelfPlayTrainer(self.agent, opponent, batch_size, seed).train
+        else:
+            player = LearnerPlayer(opponent)
+
+            def play(n):
+                for _ in range(n):
+                    game = self.game_class(self.agent, player=player)
+                    game.start()
+                return n
+
+        self.teach(play, episodes, report_every, checkpoint_every)
+
+
+def checkLoadedAgent(agent, args):
+    """
+    Raise a ValueError if a loaded agent cannot be trained with the given
+    options. The options of new agents are checked with the arguments.
+    """
+    if agent.actions != BOARD_ACTIONS:
+        raise ValueError("The agent at {} was trained on another board size "
+                         "(see the mnk command).".format(args.path))
+    batched = args.batch_size is not None or args.workers is not None
+    if batched and isinstance(agent.Q, SymmetricQTable):
+        raise ValueError("The agent at {} is symmetric, which is not "
+                         "supported with batched or parallel "
+                         "training.".format(args.path))
+    if batched and isinstance(agent, ReplayQlearner):
+        raise ValueError("The agent at {} learns from experience replay, which "
+                         "is not supported with batched or parallel "
+                         "training.".format(args.path))
+    if args.batch_size is not None and isinstance(agent, TraceLearner):
+        raise ValueError("The agent at {} has eligibility traces, which are "
+                         "not supported with batched "
+                         "training.".format(args.path))
+
+
+def askPlayAgain(games_played):
+    """ Ask the human whether to play another game. """
+    print("Games played: %i" % games_played)
+    while True:
+        play = input("Do you want to play again? [y/n]: ")
+        if play == 'y' or play == 'yes':
+            return True
+        elif play == 'n' or play == 'no':
+            return False
+        else:
+            print("Invalid input. Please choose 'y' or 'n'.")
+
+
+def playPolicy(path, seed=None):
+    """
+    Loop through games of a human player against a compiled policy (see
+    policy.compilePolicy). The policy does not learn, and neither NumPy nor
+    the game index are loaded, so the first move comes quickly.
+    """
+    from tictactoe.policy import CompiledPolicy
+    agent = CompiledPolicy.load(path, seed)
+    print("Welcome to Tic-Tac-Toe. You are 'X' and the computer is 'O'.")
+    games_played = 0
+    while True:
+        BitGame(agent).start()
+        games_played += 1
+        if not askPlayAgain(games_played):
+            print("OK. Quitting.")
+            break
+
+
+def parseSearchValues(values):
+    """
+    Parse the values of a swept hyperparameter: either a list of numbers,
+    or a single 'LOW:HIGH' range for random search.
+    """
+    if len(values) == 1 and ':' in values[0]:
+        low, high = values[0].split(':')
+        return float(low), float(high)
+    return [float(v) for v in values]
+
+
+# Learning rate of new agents, and of new agents with eligibility traces.
+# Traces spread each TD error over the whole game, so they take smaller steps
+ALPHA = 0.5
+TRACE_ALPHA = 0.2
+# Trace decay rate of new agents when --lam is given without a value
+TRACE_LAM = 0.9
+
+
+def lambdaLearner(agent_type):
+    """ The learner class with eligibility traces for an agent type. """
+    return QLambdalearner if agent_type == 'q' else SARSALambdalearner
+
+
+def addTraceArguments(parser):
+    """ Add the options of learners with eligibility traces. """
+    parser.add_argument("--lam", type=float, nargs='?', default=None,
+                        const=TRACE_LAM,
+                        help="train a new agent with eligibility traces "
+                             "(Q(lambda) or SARSA(lambda)) that decay by "
+                             "GAMMA*LAM per step (default LAM: %s)" % TRACE_LAM)
+    parser.add_argument("--trace", type=str, default="replacing",
+                        choices=TRACE_KINDS,
+                        help="whether a revisit adds to a trace or resets it "
+                             "to 1")
+
+
+def addCommonArguments(parser):
+    """ Add the options shared by interactive play and the train command. """
     parser.add_argument('-a', "--agent_type", type=str, default="q",
                         choices=['q', 's'],
                         help="Specify the computer agent learning algorithm. "
@@ -95,23 +333,537 @@ if __name__ == "__main__":
     parser.add_argument("-p", "--path", type=str, required=False,
                         help="Specify the path for the agent pickle file. "
                              "Defaults to q_agent.pkl for AGENT_TYPE='q' and "
-                             "sarsa_agent.pkl for AGENT_TYPE='s'.")
+                             "sarsa_agent.pkl for AGENT_TYPE='s'. Paths ending "
+                             "in .ckpt are saved as binary checkpoints. In "
+                             "interactive play, only a .ckpt agent with a "
+                             "dense Q-table is saved incrementally; other "
+                             "agents are rewritten in full after each game.")
     parser.add_argument("-l", "--load", action="store_true",
                         help="whether to load trained agent")
+    parser.add_argument("-q", "--qtable", type=str, default="dict",
+                        choices=['dict', 'dense', 'sparse', 'lazy'],
+                        help="Q-table storage for a new agent. QTABLE='dict' "
+                             "keeps one dictionary per action, QTABLE='dense' "
+                             "keeps all Q values in a single NumPy array, "
+                             "QTABLE='sparse' keeps one row per visited state "
+                             "and QTABLE='lazy' adds a cap (--max_states) and "
+                             "usage statistics to 'sparse'.")
+    parser.add_argument("--max_states", type=int, default=None,
+                        help="with QTABLE='lazy', evict rarely used states "
+                             "beyond MAX_STATES")
+    parser.add_argument("--eviction", type=str, default="lru",
+                        choices=EVICTION_POLICIES,
+                        help="which states a capped table evicts: the least "
+                             "recently used or the least visited")
+    parser.add_argument("-b", "--batch_size", default=None, type=int,
+                        help="when training with the teacher, play BATCH_SIZE "
+                             "games in lockstep as NumPy arrays. Implies the "
+                             "dense Q-table.")
+    parser.add_argument("-w", "--workers", default=None, type=int,
+                        help="when training with the teacher, play the games "
+                             "in WORKERS processes that share one dense "
+                             "Q-table")
+    parser.add_argument("--sync_interval", default=1000, type=int,
+                        help="episodes each worker plays between Q-table "
+                             "merges")
+    parser.add_argument("--merge", type=str, default="mean",
+                        choices=MERGE_POLICIES,
+                        help="how the Q-table updates of the workers are "
+                             "combined")
+    parser.add_argument("-s", "--symmetric", action="store_true",
+                        help="share Q values between boards that are "
+                             "rotations or reflections of one another")
+    parser.add_argument("--perfect", action="store_true",
+                        help="train against a teacher that looks its moves "
+                             "up in the fully solved game instead of "
+                             "following the heuristic strategy")
+    parser.add_argument("--teacher_level", default=0.9, type=float,
+                        help="probability that the teacher makes the optimal "
+                             "move rather than a random one")
+    parser.add_argument("--reward_capacity", default=None, type=int,
+                        help="keep only the most recent REWARD_CAPACITY "
+                             "rewards in a new agent's reward log")
+    parser.add_argument("--episode_log", type=str, default=None,
+                        help="append the final reward and length of every "
+                             "episode to this CSV file")
+    parser.add_argument("--bitboard", action="store_true",
+                        help="hold the game board in bit masks instead of "
+                             "a list of lists")
+    parser.add_argument("--replay", type=int, default=None,
+                        help="train a new Q-learning agent from an experience "
+                             "replay buffer of REPLAY transitions. Implies the "
+                             "dense Q-table.")
+    parser.add_argument("--replay_batch", type=int, default=256,
+                        help="transitions per replay minibatch")
+    parser.add_argument("--replay_every", type=int, default=64,
+                        help="new transitions between replay rounds")
+    parser.add_argument("--replay_passes", type=int, default=1,
+                        help="minibatch updates per replay round")
+    parser.add_argument("--prioritized", action="store_true",
+                        help="sample replayed transitions by the size of "
+                             "their last TD error")
+    addTraceArguments(parser)
+
+
+def addTrainingArguments(parser):
+    """ Add the options shared by the train and selfplay commands. """
+    parser.add_argument("-e", "--episodes", type=int, required=True,
+                        help="number of games to train for")
+    parser.add_argument("--alpha", type=float, default=None,
+                        help="learning rate (default: %s, or %s with --lam)"
+                             % (ALPHA, TRACE_ALPHA))
+    parser.add_argument("--gamma", type=float, default=0.9,
+                        help="temporal discounting rate")
+    parser.add_argument("--epsilon", type=float, default=0.1,
+                        help="probability of random action vs. greedy action")
+    parser.add_argument("--eps_decay", type=float, default=0.,
+                        help="geometric epsilon decay rate per action")
+    parser.add_argument("--seed", type=int, default=None,
+                        help="seed for all random number generators")
+    parser.add_argument("--checkpoint_every", type=int, default=None,
+                        help="save the agent every CHECKPOINT_EVERY games")
+    parser.add_argument("--report_every", type=int, default=0,
+                        help="print progress every REPORT_EVERY games "
+                             "(0 = silent)")
+    parser.add_argument("-f", "--force", action="store_true",
+                        help="overwrite an existing agent file")
+
+
+if __name__ == "__main__":
+    # Parse command line arguments
+    parser = argparse.ArgumentParser(description="Play Tic-Tac-Toe.")
+    addCommonArguments(parser)
     parser.add_argument("-t", "--teacher_episodes", default=None, type=int,
                         help="employ teacher agent who knows the optimal "
                              "strategy and will play for TEACHER_EPISODES games")
+    parser.add_argument("--policy", type=str, default=None,
+                        help="play against the compiled policy at POLICY "
+                             "(see the compile command) instead of a learning "
+                             "agent")
+    commands = parser.add_subparsers(dest="command")
+    train = commands.add_parser("train", help="train an agent against the "
+                                "teacher without any interactive I/O")
+    addCommonArguments(train)
+    addTrainingArguments(train)
+    train.add_argument("--metrics", type=str, default=None,
+                       help="append periodic JSON-lines reports of phase "
+                            "timings, throughput, Q-table size, epsilon and "
+                            "win/draw/loss rates to this file")
+    train.add_argument("--metrics_every", type=int, default=1000,
+                       help="games between metrics reports")
+    train.add_argument("--profile", type=str, default=None,
+                       help="run under cProfile and tracemalloc, writing "
+                            "PROFILE.prof and PROFILE.txt")
+    selfplay = commands.add_parser("selfplay", help="train an agent against "
+                                   "a second learner instead of the teacher")
+    addCommonArguments(selfplay)
+    addTrainingArguments(selfplay)
+    selfplay.add_argument("--separate", action="store_true",
+                          help="give the 'X' learner its own Q-table instead "
+                               "of sharing the agent's")
+    selfplay.add_argument("--opponent_path", type=str, default=None,
+                          help="path of the 'X' learner with --separate. "
+                               "Defaults to the agent's path with '_x' added")
+    grid = commands.add_parser("mnk", help="train an agent against a "
+                               "heuristic teacher on an m x n board with k "
+                               "in a row to win")
+    grid.add_argument('-a', "--agent_type", type=str, default="q",
+                      choices=['q', 's'],
+                      help="learner class of the agent")
+    grid.add_argument("-m", "--rows", type=int, default=4,
+                      help="number of rows of the board")
+    grid.add_argument("-n", "--columns", type=int, default=4,
+                      help="number of columns of the board")
+    grid.add_argument("-k", "--win_length", type=int, default=3,
+                      help="number of tokens in a row that wins")
+    grid.add_argument("-p", "--path", type=str, default="mnk_agent.pkl",
+                      help="path of the agent pickle file")
+    grid.add_argument("-l", "--load", action="store_true",
+                      help="continue training the agent saved at PATH")
+    grid.add_argument("--teacher_level", default=0.9, type=float,
+                      help="probability that the teacher follows its "
+                           "strategy rather than making a random move")
+    grid.add_argument("--max_states", type=int, default=None,
+                      help="keep at most MAX_STATES states in the Q-table, "
+                           "evicting rarely used ones")
+    grid.add_argument("--eviction", type=str, default="lru",
+                      choices=EVICTION_POLICIES,
+                      help="which states are evicted: the least recently "
+                           "used or the least visited")
+    addTraceArguments(grid)
+    addTrainingArguments(grid)
+    compiler = commands.add_parser("compile", help="compile a saved agent's "
+                                   "greedy policy into a small file that "
+                                   "loads quickly for interactive play")
+    compiler.add_argument("-p", "--path", type=str, required=True,
+                          help="path of the agent to compile")
+    compiler.add_argument("-o", "--output", type=str, default=None,
+                          help="policy file path. Defaults to the agent's "
+                               "path with the extension .policy")
+    serve = commands.add_parser("serve", help="host games against a trained "
+                                "agent over TCP or a Unix socket")
+    serve.add_argument("-p", "--path", type=str, required=True,
+                       help="path of the agent to serve")
+    serve.add_argument("--host", type=str, default="127.0.0.1")
+    serve.add_argument("--port", type=int, default=8765)
+    serve.add_argument("--unix", type=str, default=None,
+                       help="listen on this Unix socket instead of TCP")
+    serve.add_argument("--learn", action="store_true",
+                       help="keep training the agent on the games played")
+    serve.add_argument("--checkpoint_interval", type=float, default=60.,
+                       help="seconds between checkpoints when learning")
+    serve.add_argument("--seed", type=int, default=None,
+                       help="seed for random tie-breaking")
+    solve = commands.add_parser("solve", help="compute the exact Q values "
+                                "against the teacher by value iteration")
+    solve.add_argument('-a', "--agent_type", type=str, default="q",
+                       choices=['q', 's'],
+                       help="learner class of the solved agent")
+    solve.add_argument("-p", "--path", type=str, default=None,
+                       help="save the solved agent to this path")
+    solve.add_argument("-q", "--qtable", type=str, default="dense",
+                       choices=['dict', 'dense'],
+                       help="Q-table storage of the solved agent")
+    solve.add_argument("--perfect", action="store_true",
+                       help="solve against the perfect teacher")
+    solve.add_argument("--teacher_level", default=0.9, type=float,
+                       help="probability that the teacher makes the optimal "
+                            "move rather than a random one")
+    solve.add_argument("--alpha", type=float, default=0.5,
+                       help="learning rate of the solved agent")
+    solve.add_argument("--gamma", type=float, default=0.9,
+                       help="temporal discounting rate")
+    solve.add_argument("--epsilon", type=float, default=0.1,
+                       help="exploration rate of the solved agent")
+    solve.add_argument("--on_policy", action="store_true",
+                       help="solve for the values of the epsilon-greedy "
+                            "policy (the SARSA fixed point) instead of the "
+                            "optimal ones")
+    solve.add_argument("--compare", type=str, nargs='+', default=[],
+                       help="report how far these saved agents are from "
+                            "optimal")
+    solve.add_argument("-f", "--force", action="store_true",
+                       help="overwrite an existing agent file")
+    evaluation = commands.add_parser("evaluate", help="score a saved agent's "
+                                     "greedy play against several opponents")
+    evaluation.add_argument("-p", "--path", type=str, required=True,
+                            help="path of the agent to evaluate")
+    evaluation.add_argument("--opponents", type=str, nargs='+',
+                            default=list(DEFAULT_OPPONENTS),
+                            help="opponents: 'random', 'teacher:LEVEL', "
+                                 "'perfect:LEVEL' or 'agent:PATH'")
+    evaluation.add_argument("-g", "--games", type=int, default=10000,
+                            help="games against each opponent")
+    evaluation.add_argument("-w", "--workers", type=int, default=None,
+                            help="worker processes (default: one per CPU)")
+    evaluation.add_argument("--seed", type=int, default=None,
+                            help="seed for the games")
+    search = commands.add_parser("sweep", help="search for good "
+                                 "hyperparameters with concurrent trials")
+    search.add_argument("--agent_types", type=str, nargs='+', default=['q'],
+                        choices=['q', 's'], help="agent types to try")
+    for name, default in (('alpha', '0.5'), ('gamma', '0.9'),
+                          ('epsilon', '0.1'), ('eps_decay', '0')):
+        search.add_argument("--" + name, type=str, nargs='+', default=[default],
+                            help="values of %s to try, or LOW:HIGH for a "
+                                 "random search range" % name)
+    search.add_argument("--random", type=int, default=None,
+                        help="run RANDOM trials drawn from the values instead "
+                             "of the full grid")
+    search.add_argument("-e", "--episodes", type=int, default=100000,
+                        help="maximum training games per trial")
+    search.add_argument("--eval_every", type=int, default=5000,
+                        help="training games between evaluations")
+    search.add_argument("--eval_games", type=int, default=1000,
+                        help="greedy games against the teacher per evaluation")
+    search.add_argument("--patience", type=int, default=3,
+                        help="stop a trial after PATIENCE evaluations without "
+                             "a better win rate")
+    search.add_argument("--min_delta", type=float, default=0.005,
+                        help="smallest win rate increase that counts as "
+                             "better")
+    search.add_argument("--teacher_level", default=0.9, type=float,
+                        help="ability level of the teacher")
+    search.add_argument("-w", "--workers", type=int, default=None,
+                        help="worker processes (default: one per CPU)")
+    search.add_argument("--seed", type=int, default=None,
+                        help="seed for the trials")
+    search.add_argument("-o", "--output", type=str, default=None,
+                        help="also write the results table to this CSV file")
     args = parser.parse_args()
+    if getattr(args, 'alpha', None) is None and hasattr(args, 'lam'):
+        args.alpha = TRACE_ALPHA if args.lam is not None else ALPHA
+
+    if args.command is None and args.policy is not None:
+        if not os.path.isfile(args.policy):
+            parser.error("Cannot load policy: file does not exist.")
+        try:
+            playPolicy(args.policy)
+        except ValueError as e:
+            parser.error(str(e))
+        sys.exit(0)
+
+    if args.command == "compile":
+        from tictactoe.policy import compilePolicy
+        if not os.path.isfile(args.path):
+            parser.error("Cannot load agent: file does not exist.")
+        try:
+            agent = loadBoardAgent(args.path)
+        except ValueError as e:
+            parser.error(str(e))
+        output = args.output or os.path.splitext(args.path)[0] + '.policy'
+        compilePolicy(agent, output)
+        print("Policy written to %s" % output)
+        sys.exit(0)
+
+    if args.command == "sweep":
+        from tictactoe import sweep
+        space = {'agent_type': args.agent_types}
+        for name in ('alpha', 'gamma', 'epsilon', 'eps_decay'):
+            try:
+                space[name] = parseSearchValues(getattr(args, name))
+            except ValueError:
+                parser.error("invalid values for --%s" % name)
+        if args.random is not None:
+            trials = sweep.randomTrials(space, args.random, args.seed)
+        elif any(isinstance(v, tuple) for v in space.values()):
+            parser.error("LOW:HIGH ranges need --random")
+        else:
+            trials = sweep.gridTrials(space)
+
+        def progress(result):
+            print("trial done: %s -> win %.3f after %i games"
+                  % (', '.join('%s=%s' % (k, result[k]) for k in sweep.PARAMETERS),
+                     result['win'], result['episodes']))
+
+        results = sweep.runSweep(trials, args.episodes, args.eval_every,
+                                 args.eval_games, args.teacher_level,
+                                 args.patience, args.min_delta, args.workers,
+                                 args.seed, progress)
+        print(sweep.formatResults(results))
+        if args.output is not None:
+            sweep.writeResults(results, args.output)
+        sys.exit(0)
+
+    if args.command == "mnk":
+        from tictactoe.checkpoint import loadAgent
+        from tictactoe.mnk import MNKGame, MNKRules, MNKTeacher
+        if args.path.endswith('.ckpt'):
+            parser.error("m,n,k agents can only be saved as pickles")
+        try:
+            rules = MNKRules(args.rows, args.columns, args.win_length)
+        except ValueError as e:
+            parser.error(str(e))
+        seeds = spawnSeeds(args.seed, 2)
+        if args.load:
+            if not os.path.isfile(args.path):
+                parser.error("Cannot load agent: file does not exist.")
+            agent = loadAgent(args.path)
+            if agent.actions != rules.actions:
+                parser.error("The agent was trained on another board size.")
+            if args.seed is not None:
+                agent.rng = makeStream(seeds[0])
+        else:
+            if os.path.isfile(args.path) and not args.force:
+                parser.error("An agent is already saved at {}. Use --force to "
+                             "overwrite.".format(args.path))
+            learner = Qlearner if args.agent_type == 'q' else SARSAlearner
+            kwargs = {}
+            if args.lam is not None:
+                learner = lambdaLearner(args.agent_type)
+                kwargs = dict(lam=args.lam, trace=args.trace)
+            agent = learner(args.alpha, args.gamma, args.epsilon,
+                            args.eps_decay, backend='lazy',
+                            actions=rules.actions, max_states=args.max_states,
+                            eviction=args.eviction, rng=seeds[0], **kwargs)
+        teacher = MNKTeacher(args.teacher_level, seeds[1])
+        counts = {1: 0, 0: 0, -1: 0}
+        for episode in range(1, args.episodes + 1):
+            counts[MNKGame(agent, teacher, rules).start()] += 1
+            if args.report_every and episode % args.report_every == 0:
+                n = sum(counts.values())
+                print("Games played: %i (win %.3f, draw %.3f, loss %.3f, "
+                      "%i states)" % (episode, counts[1]/n, counts[0]/n,
+                                      counts[-1]/n, len(agent.Q.rows)))
+                if hasattr(agent.Q, 'stats'):
+                    stats = agent.Q.stats()
+                    print("  Q-table: %.1f MB, hit rate %.3f, %i evicted"
+                          % (stats['bytes']/2**20, stats['hit_rate'],
+                             stats['evictions']))
+                counts = {1: 0, 0: 0, -1: 0}
+            if args.checkpoint_every and episode % args.checkpoint_every == 0:
+                agent.save(args.path)
+        agent.save(args.path)
+        sys.exit(0)
+
+    if args.command == "evaluate":
+        if not os.path.isfile(args.path):
+            parser.error("Cannot load agent: file does not exist.")
+        try:
+            results = evaluate(args.path, args.opponents, args.games,
+                               args.workers, args.seed)
+        except ValueError as e:
+            parser.error(str(e))
+        print(formatResults(results))
+        sys.exit(0)
+
+    if args.command == "solve":
+        from tictactoe.checkpoint import saveAgent
+        from tictactoe.solver import Solution
+        if args.path is not None and os.path.isfile(args.path) and not args.force:
+            parser.error("An agent is already saved at {}. Use --force to "
+                         "overwrite.".format(args.path))
+        teacher_class = PerfectTeacher if args.perfect else Teacher
+        teacher = teacher_class(args.teacher_level)
+        optimal = Solution(teacher, args.gamma)
+        solution = optimal
+        if args.on_policy:
+            solution = Solution(teacher, args.gamma, args.epsilon)
+        try:
+            compare = [loadBoardAgent(path, mmap=False) for path in args.compare]
+        except ValueError as e:
+            parser.error(str(e))
+        report = optimal.evaluate(optimal.greedyPolicy(optimal.Q))
+        print("Optimal play: value %.4f, win %.4f, draw %.4f, loss %.4f"
+              % (report['value'], report['win'], report['draw'], report['loss']))
+        for path, trained in zip(args.compare, compare):
+            gap = optimal.optimalityGap(trained)
+            agent = gap['agent']
+            print("%s: value %.4f (gap %.4f), win %.4f, draw %.4f, loss %.4f"
+                  % (path, agent['value'], gap['gap'], agent['win'],
+                     agent['draw'], agent['loss']))
+            print("  suboptimal in %.1f%% of visited states, %.4f suboptimal "
+                  "moves per game, Q error mean %.4f max %.4f"
+                  % (100*gap['suboptimal_states'], gap['suboptimal_moves'],
+                     gap['q_error_mean'], gap['q_error_max']))
+        if args.path is not None:
+            learner = Qlearner if args.agent_type == 'q' else SARSAlearner
+            saveAgent(solution.makeAgent(learner, args.alpha, args.epsilon,
+                                         backend=args.qtable), args.path)
+        sys.exit(0)
+
+    if args.command == "serve":
+        import asyncio
+        from tictactoe.server import GameServer
+        if not os.path.isfile(args.path):
+            parser.error("Cannot load agent: file does not exist.")
+        try:
+            agent = loadBoardAgent(args.path, mmap=not args.learn)
+        except ValueError as e:
+            parser.error(str(e))
+        server = GameServer(agent, args.learn, args.path,
+                            args.checkpoint_interval, args.seed)
+        try:
+            asyncio.run(server.serve(args.host, args.port, args.unix))
+        except KeyboardInterrupt:
+            pass
+        sys.exit(0)
+
+    if args.batch_size is not None or args.workers is not None:
+        if args.symmetric:
+            parser.error("--symmetric is not supported with batched or "
+                         "parallel training")
+        args.qtable = 'dense'
+    if args.replay is not None:
+        if args.agent_type != 'q':
+            parser.error("--replay requires the Q-learning agent")
+        if args.symmetric or args.batch_size is not None or args.workers is not None:
+            parser.error("--replay is not supported with --symmetric or with "
+                         "batched or parallel training")
+        args.qtable = 'dense'
+    if args.lam is not None:
+        if args.replay is not None or args.batch_size is not None:
+            parser.error("--lam is not supported with --replay or with "
+                         "batched training")
 
     # set default path
     if args.path is None:
         args.path = 'q_agent.pkl' if args.agent_type == 'q' else 'sarsa_agent.pkl'
+    if args.path.endswith('.ckpt') and args.max_states is not None:
+        parser.error("Agents with --max_states can only be saved as pickles")
+
+    if args.command == "selfplay":
+        if args.workers is not None or args.replay is not None:
+            parser.error("--workers and --replay are not supported in "
+                         "self-play")
+        opponent_path = None
+        if args.separate:
+            root, ext = os.path.splitext(args.path)
+            opponent_path = args.opponent_path or root + '_x' + ext
+            if os.path.isfile(opponent_path) and not (args.load or args.force):
+                parser.error("An agent is already saved at {}. Use --force to "
+                             "overwrite.".format(opponent_path))
+        try:
+            gl = GameLearning(args, args.alpha, args.gamma, args.epsilon,
+                              args.eps_decay, interactive=False)
+        except ValueError as e:
+            parser.error(str(e))
+        from tictactoe.checkpoint import loadAgent
+        from tictactoe.selfplay import mirrorLearner
+        if args.separate and args.load and os.path.isfile(opponent_path):
+            opponent = loadAgent(opponent_path)
+            if args.seed is not None:
+                opponent.rng = makeStream(gl.teacher_seed)
+            try:
+                checkLoadedAgent(opponent, args)
+            except ValueError as e:
+                parser.error(str(e))
+        else:
+            # the opponent takes the random stream the teacher would use
+            opponent = mirrorLearner(gl.agent, not args.separate,
+                                     gl.teacher_seed)
+        gl.beginSelfPlay(args.episodes, opponent, opponent_path,
+                         args.batch_size, args.seed, args.report_every,
+                         args.checkpoint_every)
+        if gl.agent.episode_log is not None:
+            gl.agent.episode_log.close()
+        sys.exit(0)
 
-    # initialize game instance
-    gl = GameLearning(args)
+    if args.command == "train":
+        try:
+            gl = GameLearning(args, args.alpha, args.gamma, args.epsilon,
+                              args.eps_decay, interactive=False)
+        except ValueError as e:
+            parser.error(str(e))
+        episodes = args.episodes
+        schedule = dict(report_every=args.report_every,
+                        checkpoint_every=args.checkpoint_every)
+        instrument = None
+        if args.metrics is not None:
+            if args.batch_size is not None or args.workers is not None:
+                parser.error("--metrics is only supported for game-by-game "
+                             "training")
+            from tictactoe.instrument import Instrumentation, JsonLinesWriter
+            instrument = Instrumentation(gl.agent, args.metrics_every)
+            instrument.addHook(JsonLinesWriter(args.metrics))
+            schedule['instrument'] = instrument
+    else:
+        # initialize game instance
+        try:
+            gl = GameLearning(args, args.alpha)
+        except ValueError as e:
+            parser.error(str(e))
+        episodes = args.teacher_episodes
+        schedule = {}
 
     # play or teach
-    if args.teacher_episodes is not None:
-        gl.beginTeaching(args.teacher_episodes)
+    def run():
+        if episodes is not None and args.batch_size is not None:
+            gl.beginBatchTeaching(episodes, args.batch_size,
+                                  getattr(args, 'seed', None), **schedule)
+        elif episodes is not None and args.workers is not None:
+            gl.beginParallelTeaching(episodes, args.workers, args.sync_interval,
+                                     args.merge, getattr(args, 'seed', None),
+                                     **schedule)
+        elif episodes is not None:
+            gl.beginTeaching(episodes, **schedule)
+        else:
+            gl.beginPlaying()
+
+    if getattr(args, 'profile', None) is not None:
+        from tictactoe.instrument import profileRun
+        profileRun(run, args.profile)
     else:
-        gl.beginPlaying()
\ No newline at end of file
+        run()
+    if gl.agent.episode_log is not None:
+        gl.agent.episode_log.close()
\ No newline at end of file
@@ -1,13 +1,15 @@
 import argparse
 import os
-import pickle
 import sys
-import numpy as np
-import matplotlib.pylab as plt
+
+# NumPy, matplotlib and the agent modules are imported where they are used,
+# so that bad arguments are reported without loading them.
 
 
 def plot_agent_reward(rewards):
     """ Function to plot agent's accumulated reward vs. iteration """
+    import numpy as np
+    import matplotlib.pylab as plt
     plt.plot(np.cumsum(rewards))
     plt.title('Agent Cumulative Reward vs. Iteration')
     plt.ylabel('Reward')
@@ -15,16 +17,52 @@ def plot_agent_reward(rewards):
     plt.show()
 
 
+def plot_episode_log(path, stride=1):
+    """
+    Function to plot accumulated reward vs. episode from an episode log,
+    reading the log in chunks and keeping every 'stride'-th point.
+    """
+    import numpy as np
+    import matplotlib.pylab as plt
+    from tictactoe.metrics import readEpisodeLog
+    xs, ys = [], []
+    total, count = 0, 0
+    for rewards, _ in readEpisodeLog(path):
+        if not len(rewards):
+            continue
+        cumulative = total + np.cumsum(rewards)
+        # keep the points whose episode number is a multiple of stride
+        first = (-count) % stride
+        xs.append(np.arange(count + first, count + len(rewards), stride) + 1)
+        ys.append(cumulative[first::stride])
+        total = cumulative[-1]
+        count += len(rewards)
+    if not xs:
+        print("The episode log is empty. Quitting.")
+        return
+    plt.plot(np.concatenate(xs), np.concatenate(ys))
+    plt.title('Agent Cumulative Reward vs. Episode')
+    plt.ylabel('Reward')
+    plt.xlabel('Episode')
+    plt.show()
+
+
 if __name__ == "__main__":
     # Parse command line arguments
     parser = argparse.ArgumentParser(description="Plot agent reward.")
-    parser.add_argument("-p", "--path", type=str, required=True)
+    parser.add_argument("-p", "--path", type=str, required=True,
+                        help="agent file, or a .csv episode log")
+    parser.add_argument("--stride", type=int, default=1,
+                        help="for episode logs, plot every STRIDE-th episode")
     args = parser.parse_args()
 
     if not os.path.isfile(args.path):
         print("Cannot load agent: file does not exist. Quitting.")
         sys.exit(0)
-    with open(args.path, 'rb') as f:
-        agent = pickle.load(f)
+    if args.path.endswith('.csv'):
+        plot_episode_log(args.path, args.stride)
+        sys.exit(0)
+    from tictactoe.checkpoint import loadAgent
+    agent = loadAgent(args.path, mmap=True)
 
     plot_agent_reward(agent.rewards)
\ No newline at end of file
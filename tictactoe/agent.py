@@ -1,9 +1,13 @@
 from abc import ABC, abstractmethod
-import os
 import pickle
-import collections
-import numpy as np
-import random
+
+from tictactoe.files import atomicOpen
+from tictactoe.metrics import makeRewardLog
+from tictactoe.qtable import (DictQTable, N_CELLS, TrackedQTable, encodeState,
+                              makeQTable)
+from tictactoe.rng import RandomStream, makeStream
+from tictactoe.states import legalActions
+from tictactoe.symmetry import SymmetricQTable
 
 
 class Learner(ABC):
@@ -20,27 +24,70 @@ class Learner(ABC):
         probability of random action vs. greedy action
     eps_decay : float
         epsilon decay rate. Larger value = more decay
+    backend : string
+        Q-table storage. 'dict' keeps one defaultdict per action; 'dense'
+        keeps all Q values in a single (3^9, 9) NumPy array; 'sparse' keeps
+        one compact row per visited state; 'lazy' is 'sparse' with an
+        optional cap on the number of states and usage statistics
+    symmetric : bool
+        whether to share Q values between boards that are rotations or
+        reflections of one another
+    reward_capacity : int
+        if given, keep only the most recent 'reward_capacity' rewards
+    episode_log : EpisodeLog
+        optional sink that receives the final reward and length of every
+        episode
+    rng : RandomStream, Generator or seed
+        source of the agent's random numbers (see rng.makeStream)
+    actions : list of (i,j) tuples
+        the set of all actions. Defaults to the cells of the 3x3 board;
+        other boards (see mnk.py) need the 'sparse', 'lazy' or 'dict' backend
+    max_states : int
+        with the 'lazy' backend, the most states kept in the table
+    eviction : string
+        with the 'lazy' backend, how states are evicted ('lru' or 'visits')
     """
-    def __init__(self, alpha, gamma, eps, eps_decay=0.):
+    def __init__(self, alpha, gamma, eps, eps_decay=0., backend='dict',
+                 symmetric=False, reward_capacity=None, episode_log=None,
+                 rng=None, actions=None, max_states=None, eviction='lru'):
         # Agent parameters
         self.alpha = alpha
         self.gamma = gamma
         self.eps = eps
         self.eps_decay = eps_decay
         # Possible actions correspond to the set of all x,y coordinate pairs
-        self.actions = []
-        for i in range(3):
-            for j in range(3):
-                self.actions.append((i,j))
+        if actions is None:
+            actions = []
+            for i in range(3):
+                for j in range(3):
+                    actions.append((i,j))
+        self.actions = list(actions)
         # Initialize Q values to 0 for all state-action pairs.
-        # Access value for action a, state s via Q[a][s]
-        self.Q = {}
-        for action in self.actions:
-            self.Q[action] = collections.defaultdict(int)
-        # Keep a list of reward received at each episode
-        self.rewards = []
+        # Access value for action a, state s via Q.get(s, a)
+        self.Q = makeQTable(backend, self.actions, max_states, eviction)
+        if symmetric:
+            self.Q = SymmetricQTable(self.Q)
+        # Keep a compact log of the reward received at each update
+        self.rewards = makeRewardLog(reward_capacity)
+        self.episode_log = episode_log
+        # Number of updates made in the current episode
+        self.steps = 0
+        self.rng = makeStream(rng)
+
+    def __setstate__(self, state):
+        # Agents pickled before the Q-table backends were introduced hold
+        # a plain dict of defaultdicts; wrap it in the equivalent table.
+        if isinstance(state['Q'], dict):
+            table = DictQTable([])
+            table.Q = state['Q']
+            state['Q'] = table
+        state.setdefault('episode_log', None)
+        state.setdefault('steps', 0)
+        if 'rng' not in state:
+            state['rng'] = RandomStream()
+        self.__dict__.update(state)
 
-    def get_action(self, s):
+    def get_action(self, s, possible_actions=None):
         """
         Select an action given the current game state.
 
@@ -48,20 +95,26 @@ class Learner(ABC):
         ----------
         s : string
             state
+        possible_actions : list of (i,j) tuples
+            the legal actions in s. Looked up for 3x3 state strings if not
+            given; required for other state keys
         """
         # Only consider the allowed actions (empty board spaces)
-        possible_actions = [a for a in self.actions if s[a[0]*3 + a[1]] == '-']
-        if random.random() < self.eps:
+        if possible_actions is None:
+            possible_actions = legalActions(s)
+        if self.rng.random() < self.eps:
             # Random choose.
-            action = possible_actions[random.randint(0,len(possible_actions)-1)]
+            action = possible_actions[self.rng.randint(0,len(possible_actions)-1)]
         else:
-            # Greedy choose.
-            values = np.array([self.Q[a][s] for a in possible_actions])
+            # Greedy choose. A single move needs no NumPy: a few Python
+            # floats are compared faster than they are converted to an array
+            values = self.Q.values(s, possible_actions)
             # Find location of max
-            ix_max = np.where(values == np.max(values))[0]
+            best = max(values)
+            ix_max = [i for i, v in enumerate(values) if v == best]
             if len(ix_max) > 1:
                 # If multiple actions were max, then sample from them
-                ix_select = np.random.choice(ix_max, 1)[0]
+                ix_select = self.rng.choice(ix_max)
             else:
                 # If unique max action, select that one
                 ix_select = ix_max[0]
@@ -73,15 +126,27 @@ class Learner(ABC):
         return action
 
     def save(self, path):
-        """ Pickle the agent object instance to save the agent's state. """
-        if os.path.isfile(path):
-            os.remove(path)
-        f = open(path, 'wb')
-        pickle.dump(self, f)
-        f.close()
+        """
+        Pickle the agent object instance to save the agent's state. The file
+        is replaced atomically, so a crash mid-save keeps the old agent.
+        """
+        with atomicOpen(path) as f:
+            pickle.dump(self, f)
+
+    def record(self, r, terminal):
+        """
+        Add reward r to the reward log. At the end of an episode, also pass
+        the final reward and the episode length to the episode log.
+        """
+        self.rewards.append(r)
+        self.steps += 1
+        if terminal:
+            if self.episode_log is not None:
+                self.episode_log.record(r, self.steps)
+            self.steps = 0
 
     @abstractmethod
-    def update(self, s, s_, a, a_, r):
+    def update(self, s, s_, a, a_, r, possible_actions_=None):
         pass
 
 
@@ -89,10 +154,10 @@ class Qlearner(Learner):
     """
     A class to implement the Q-learning agent.
     """
-    def __init__(self, alpha, gamma, eps, eps_decay=0.):
-        super().__init__(alpha, gamma, eps, eps_decay)
+    def __init__(self, alpha, gamma, eps, eps_decay=0., **kwargs):
+        super().__init__(alpha, gamma, eps, eps_decay, **kwargs)
 
-    def update(self, s, s_, a, a_, r):
+    def update(self, s, s_, a, a_, r, possible_actions_=None):
         """
         Perform the Q-Learning update of Q values.
 
@@ -108,30 +173,121 @@ class Qlearner(Learner):
             new action. NOT used by Q-learner!
         r : int
             reward received after executing action "a" in state "s"
+        possible_actions_ : list of (i,j) tuples
+            the legal actions in s_ (see get_action)
         """
         # Update Q(s,a)
         if s_ is not None:
             # hold list of Q values for all a_,s_ pairs. We will access the max later
-            possible_actions = [action for action in self.actions if s_[action[0]*3 + action[1]] == '-']
-            Q_options = [self.Q[action][s_] for action in possible_actions]
+            possible_actions = possible_actions_
+            if possible_actions is None:
+                possible_actions = legalActions(s_)
+            Q_options = self.Q.values(s_, possible_actions)
             # update
-            self.Q[a][s] += self.alpha*(r + self.gamma*max(Q_options) - self.Q[a][s])
+            self.Q.add(s, a, self.alpha*(r + self.gamma*max(Q_options) - self.Q.get(s, a)))
         else:
             # terminal state update
-            self.Q[a][s] += self.alpha*(r - self.Q[a][s])
+            self.Q.add(s, a, self.alpha*(r - self.Q.get(s, a)))
 
-        # add r to rewards list
-        self.rewards.append(r)
+        # add r to rewards log
+        self.record(r, s_ is None)
+
+
+class ReplayQlearner(Qlearner):
+    """
+    A Q-learning agent that learns from an experience replay buffer. Each
+    transition is stored instead of being applied right away, and every
+    'replay_every' transitions the agent makes 'passes' vectorized
+    minibatch updates from transitions drawn from the buffer. Requires the
+    dense Q-table.
+
+    The buffer is kept when the agent is pickled; binary checkpoints only
+    hold the Q values, so an agent loaded from one starts with an empty
+    buffer.
+
+    Parameters
+    ----------
+    capacity : int
+        number of transitions held by the buffer
+    batch_size : int
+        transitions per minibatch
+    replay_every : int
+        number of new transitions between rounds of minibatch updates
+    passes : int
+        minibatch updates per round
+    prioritized : bool
+        sample transitions by the size of their last TD error
+    """
+    def __init__(self, alpha, gamma, eps, eps_decay=0., capacity=100000,
+                 batch_size=256, replay_every=64, passes=1, prioritized=False,
+                 **kwargs):
+        if kwargs.pop('symmetric', False) or kwargs.pop('backend', 'dense') != 'dense':
+            raise ValueError("Experience replay requires the dense, "
+                             "non-symmetric Q-table.")
+        super().__init__(alpha, gamma, eps, eps_decay, backend='dense', **kwargs)
+        # replay is vectorized; its modules are only imported when used
+        from tictactoe.replay import ReplayBuffer
+        # the buffer samples from the agent's generator
+        self.replay = ReplayBuffer(capacity, prioritized, seed=self.rng.generator)
+        self.batch_size = batch_size
+        self.replay_every = replay_every
+        self.passes = passes
+
+    @property
+    def capacity(self):
+        return self.replay.capacity
+
+    @property
+    def prioritized(self):
+        return self.replay.prioritized
+
+    def update(self, s, s_, a, a_, r, possible_actions_=None):
+        """
+        Store a transition, and replay minibatches when a round is due.
+        Parameters are as for Qlearner.update.
+        """
+        done = s_ is None
+        self.replay.add(encodeState(s), a[0]*3 + a[1], r,
+                        None if done else encodeState(s_), done)
+        self.record(r, done)
+        if self.replay.count % self.replay_every == 0:
+            self.learn(self.passes)
+
+    def learn(self, passes=1):
+        """
+        Make 'passes' minibatch Q-learning updates from the buffer. Updates
+        of duplicate (state, action) pairs within a minibatch are averaged.
+        """
+        import numpy as np
+        from tictactoe.replay import legalFromCodes
+        buf = self.replay
+        Q = self.Q.array
+        for _ in range(passes):
+            idx, weights = buf.sample(self.batch_size)
+            s, a, s_ = buf.states[idx], buf.actions[idx], buf.next_states[idx]
+            values = np.where(legalFromCodes(s_), Q[s_], -np.inf).max(axis=1)
+            target = buf.rewards[idx] + np.where(buf.done[idx], 0.,
+                                                 self.gamma*values)
+            error = target - Q[s, a]
+            flat, inverse, counts = np.unique(s*N_CELLS + a, return_inverse=True,
+                                              return_counts=True)
+            delta = np.bincount(inverse, weights=self.alpha*weights*error)
+            Q.reshape(-1)[flat] += delta/counts
+            if isinstance(self.Q, TrackedQTable):
+                # the updates bypass Q.add; log them for the checkpoint
+                self.Q.dirty.update(flat.tolist())
+            if buf.prioritized:
+                buf.updatePriorities(idx, error)
 
 
 class SARSAlearner(Learner):
     """
     A class to implement the SARSA agent.
     """
-    def __init__(self, alpha, gamma, eps, eps_decay=0.):
-        super().__init__(alpha, gamma, eps, eps_decay)
+    def __init__(self, alpha, gamma, eps, eps_decay=0., **kwargs):
+        super().__init__(alpha, gamma, eps, eps_decay, **kwargs)
 
-    def update(self, s, s_, a, a_, r):
+    def update(self, s, s_, a, a_, r, possible_actions_=None):
         """
         Perform the SARSA update of Q values.
 
@@ -147,13 +303,139 @@ class SARSAlearner(Learner):
             new action
         r : int
             reward received after executing action "a" in state "s"
+        possible_actions_ : list of (i,j) tuples
+            NOT used by the SARSA learner
         """
         # Update Q(s,a)
         if s_ is not None:
-            self.Q[a][s] += self.alpha*(r + self.gamma*self.Q[a_][s_] - self.Q[a][s])
+            self.Q.add(s, a, self.alpha*(r + self.gamma*self.Q.get(s_, a_) - self.Q.get(s, a)))
         else:
             # terminal state update
-            self.Q[a][s] += self.alpha*(r - self.Q[a][s])
+            self.Q.add(s, a, self.alpha*(r - self.Q.get(s, a)))
 
-        # add r to rewards list
-        self.rewards.append(r)
+        # add r to rewards log
+        self.record(r, s_ is None)
+
+
+# Ways a visit raises the eligibility of a (state, action) pair
+TRACE_KINDS = ('accumulating', 'replacing')
+
+
+class TraceLearner(Learner):
+    """
+    Parent class for learners with eligibility traces (Q(lambda) and
+    SARSA(lambda)). Every (state, action) pair visited in the current
+    episode keeps an eligibility, and each TD error updates all of them in
+    proportion, so a terminal reward reaches the whole episode at once
+    instead of one state further back per episode.
+
+    The traces are a dict from (state, action) to eligibility that only
+    holds the pairs of the current episode. Eligibilities decay by
+    gamma*lam per step; those that fall below 'cutoff' are dropped, and the
+    dict is emptied at the end of each episode. With lam=0 the updates are
+    those of the one-step learners.
+
+    Parameters
+    ----------
+    lam : float
+        trace decay rate, between 0 (one-step TD) and 1 (Monte Carlo)
+    trace : string
+        'accumulating' adds 1 to the eligibility of a pair on each visit;
+        'replacing' sets it to 1
+    cutoff : float
+        smallest eligibility that is kept
+    """
+    def __init__(self, alpha, gamma, eps, eps_decay=0., lam=0.9,
+                 trace='replacing', cutoff=1e-4, **kwargs):
+        if trace not in TRACE_KINDS:
+            raise ValueError("Unknown trace kind '%s'." % trace)
+        super().__init__(alpha, gamma, eps, eps_decay, **kwargs)
+        self.lam = lam
+        self.trace = trace
+        self.cutoff = cutoff
+        self.eligibility = {}
+
+    def visit(self, s, a):
+        """ Raise the eligibility of taking action a in state s. """
+        if self.trace == 'accumulating':
+            self.eligibility[(s, a)] = self.eligibility.get((s, a), 0.) + 1.
+        else:
+            self.eligibility[(s, a)] = 1.
+
+    def propagate(self, delta):
+        """ Update every eligible pair with the TD error 'delta'. """
+        step = self.alpha*delta
+        for (s, a), e in self.eligibility.items():
+            self.Q.add(s, a, step*e)
+
+    def decay(self):
+        """ Decay the eligibilities by gamma*lam, dropping negligible ones. """
+        factor = self.gamma*self.lam
+        cutoff = self.cutoff
+        self.eligibility = {key: e*factor for key, e in self.eligibility.items()
+                            if e*factor >= cutoff}
+
+    def endEpisode(self):
+        """ Forget the traces of the episode that just ended. """
+        self.eligibility.clear()
+
+
+class QLambdalearner(TraceLearner):
+    """
+    A class to implement Watkins' Q(lambda) agent. The traces follow the
+    greedy policy that Q-learning evaluates, so they are cut whenever the
+    agent's next action is exploratory.
+    """
+    def __init__(self, alpha, gamma, eps, eps_decay=0., **kwargs):
+        super().__init__(alpha, gamma, eps, eps_decay, **kwargs)
+
+    def update(self, s, s_, a, a_, r, possible_actions_=None):
+        """
+        Perform the Q(lambda) update of Q values. Parameters are as for
+        Qlearner.update; a_ tells whether the traces are kept (a greedy
+        action, or None) or cut (an exploratory action).
+        """
+        self.visit(s, a)
+        if s_ is not None:
+            possible_actions = possible_actions_
+            if possible_actions is None:
+                possible_actions = legalActions(s_)
+            best = max(self.Q.values(s_, possible_actions))
+            greedy = a_ is None or self.Q.get(s_, a_) == best
+            self.propagate(r + self.gamma*best - self.Q.get(s, a))
+            if greedy:
+                self.decay()
+            else:
+                self.endEpisode()
+        else:
+            # terminal state update
+            self.propagate(r - self.Q.get(s, a))
+            self.endEpisode()
+
+        # add r to rewards log
+        self.record(r, s_ is None)
+
+
+class SARSALambdalearner(TraceLearner):
+    """
+    A class to implement the SARSA(lambda) agent.
+    """
+    def __init__(self, alpha, gamma, eps, eps_decay=0., **kwargs):
+        super().__init__(alpha, gamma, eps, eps_decay, **kwargs)
+
+    def update(self, s, s_, a, a_, r, possible_actions_=None):
+        """
+        Perform the SARSA(lambda) update of Q values. Parameters are as for
+        SARSAlearner.update.
+        """
+        self.visit(s, a)
+        if s_ is not None:
+            self.propagate(r + self.gamma*self.Q.get(s_, a_) - self.Q.get(s, a))
+            self.decay()
+        else:
+            # terminal state update
+            self.propagate(r - self.Q.get(s, a))
+            self.endEpisode()
+
+        # add r to rewards log
+        self.record(r, s_ is None)
@@ -0,0 +1,239 @@
+import numpy as np
+
+from tictactoe.agent import Qlearner, TraceLearner
+from tictactoe.qtable import DenseQTable, N_CELLS, N_STATES, decodeState
+
+
+# Cell values of a batched board. These match the base-3 digits used by
+# qtable.encodeState, so that a row of the board array can be encoded with
+# a dot product against POWERS.
+EMPTY, AGENT, TEACHER = 0, 1, 2
+POWERS = 3**np.arange(N_CELLS-1, -1, -1)
+
+# Flat cell indices of the 8 lines that win the game.
+LINES = np.array([[0, 1, 2], [3, 4, 5], [6, 7, 8],
+                  [0, 3, 6], [1, 4, 7], [2, 5, 8],
+                  [0, 4, 8], [2, 4, 6]])
+
+
+def encodeBoards(boards):
+    """ Encode an (N,9) array of boards into N integer state indices. """
+    return boards.astype(np.int64) @ POWERS
+
+
+def hasWon(boards, token):
+    """ For each board in an (N,9) array, check if 'token' holds a line. """
+    return (boards[:, LINES] == token).all(axis=2).any(axis=1)
+
+
+def isFull(boards):
+    """ For each board in an (N,9) array, check if every cell is taken. """
+    return (boards != EMPTY).all(axis=1)
+
+
+def randomLegal(legal, rng):
+    """ Pick a uniformly random legal cell for each row of a boolean mask. """
+    return np.argmax(np.where(legal, rng.random(legal.shape), -1.), axis=1)
+
+
+def selectActions(values, legal, eps, rng):
+    """
+    Epsilon-greedy action selection for a batch of states. Ties between
+    greedy actions are broken at random.
+
+    Parameters
+    ----------
+    values : (N,9) array
+        Q values of each state
+    legal : (N,9) boolean array
+        mask of the allowed actions (empty board cells)
+    eps : float
+        probability of random action vs. greedy action
+    rng : numpy Generator
+        random number generator
+    """
+    masked = np.where(legal, values, -np.inf)
+    best = masked == masked.max(axis=1, keepdims=True)
+    greedy = np.argmax(np.where(best, rng.random(values.shape), -1.), axis=1)
+    explore = rng.random(len(values)) < eps
+    return np.where(explore, randomLegal(legal, rng), greedy)
+
+
+class BatchTeacher:
+    """
+    Vectorized wrapper around a Teacher. The teacher's optimal move only
+    depends on the board, so it is computed once per state and cached in a
+    table indexed by encoded state. For a teacher with random_ties (see
+    PerfectTeacher), all optimal moves of each state are cached, and one of
+    them is drawn at random for each game.
+
+    Parameters
+    ----------
+    teacher : Teacher
+        the teacher whose strategy and ability level are used
+    """
+    def __init__(self, teacher):
+        self.teacher = teacher
+        self.ties = getattr(teacher, 'random_ties', False)
+        self.moves = np.full(N_STATES, -1, dtype=np.int8)
+        # with random ties, a (N_STATES, 9) mask of all the optimal moves
+        self.optimal = np.zeros((N_STATES, N_CELLS), dtype=bool)
+
+    def optimalMoves(self, codes):
+        """ Look up (computing if needed) the optimal move for each state. """
+        moves = self.moves[codes]
+        missing = np.unique(codes[moves < 0])
+        for code in missing:
+            key = decodeState(int(code))
+            board = [list(key[0:3]), list(key[3:6]), list(key[6:9])]
+            i, j = self.teacher.optimalMove(board)
+            self.moves[code] = i*3 + j
+            if self.ties:
+                for i, j in self.teacher.optimalMoves(board):
+                    self.optimal[code, i*3 + j] = True
+        if len(missing):
+            moves = self.moves[codes]
+        return moves
+
+    def makeMoves(self, boards, rng):
+        """ Choose a move for each board of an (N,9) array. """
+        codes = encodeBoards(boards)
+        optimal = self.optimalMoves(codes)
+        if self.ties:
+            optimal = randomLegal(self.optimal[codes], rng)
+        follow = rng.random(len(boards)) <= self.teacher.ability_level
+        return np.where(follow, optimal, randomLegal(boards == EMPTY, rng))
+
+
+class BatchTrainer:
+    """
+    Trains a Qlearner or SARSAlearner against a teacher by advancing many
+    independent games in lockstep as NumPy arrays. The agent must use the
+    dense Q-table backend.
+
+    All transitions of one step are applied as a single batched update. When
+    several games share the same (state, action) pair in a step, their
+    updates are averaged rather than summed, so that a large batch does not
+    overshoot the target.
+
+    Parameters
+    ----------
+    agent : Learner
+        the agent to train. Its Q values and epsilon are updated in place
+    teacher : Teacher
+        the opponent. None for a trainer that is only used for its
+        getActions and update (see selfplay.SelfPlayTrainer)
+    batch_size : int
+        number of games played in lockstep
+    seed : int, SeedSequence or Generator
+        seed for the random number generator
+    """
+    def __init__(self, agent, teacher, batch_size=1024, seed=None):
+        if not isinstance(agent.Q, DenseQTable):
+            raise ValueError("Batched training requires the dense Q-table "
+                             "backend.")
+        if isinstance(agent, TraceLearner):
+            raise ValueError("Batched training does not support eligibility "
+                             "traces.")
+        self.agent = agent
+        self.teacher = None if teacher is None else BatchTeacher(teacher)
+        self.batch_size = batch_size
+        self.rng = np.random.default_rng(seed)
+        self.q_learning = isinstance(agent, Qlearner)
+
+    def getActions(self, boards):
+        """ Epsilon-greedy agent actions for an (N,9) array of boards. """
+        agent = self.agent
+        actions = selectActions(agent.Q.array[encodeBoards(boards)],
+                                boards == EMPTY, agent.eps, self.rng)
+        # update epsilon; geometric decay, once per selected action
+        agent.eps *= (1.-agent.eps_decay)**len(boards)
+        return actions
+
+    def update(self, s, a, r, s_=None, boards_=None, a_=None):
+        """
+        Apply a batch of Q-learning or SARSA updates.
+
+        Parameters
+        ----------
+        s : int array
+            previous encoded states
+        a : int array
+            previous actions (flat cell indices)
+        r : float array
+            rewards received after executing "a" in "s"
+        s_ : int array
+            new encoded states, or None for terminal transitions
+        boards_ : (N,9) array
+            new boards. Used by the Q-learner to mask illegal actions
+        a_ : int array
+            new actions. Used by the SARSA learner
+        """
+        Q = self.agent.Q.array
+        target = r.astype(np.float64)
+        if s_ is not None:
+            if self.q_learning:
+                values = np.where(boards_ == EMPTY, Q[s_], -np.inf)
+                target += self.agent.gamma*values.max(axis=1)
+            else:
+                target += self.agent.gamma*Q[s_, a_]
+        delta = self.agent.alpha*(target - Q[s, a])
+        # average the updates of duplicate (state, action) pairs
+        flat, inverse, counts = np.unique(s*N_CELLS + a, return_inverse=True,
+                                          return_counts=True)
+        mean_delta = np.bincount(inverse, weights=delta) / counts
+        Q.reshape(-1)[flat] += mean_delta
+        # add r to rewards log
+        self.agent.rewards.extend(r.astype(int).tolist())
+
+    def playBatch(self, n):
+        """ Play n games in lockstep, updating the agent as they go. """
+        rng = self.rng
+        boards = np.zeros((n, N_CELLS), dtype=np.int8)
+        # chose who goes first randomly with equal probability
+        teacher_first = rng.random(n) >= 0.5
+        if teacher_first.any():
+            rows = np.flatnonzero(teacher_first)
+            boards[rows, self.teacher.makeMoves(boards[rows], rng)] = TEACHER
+        s = encodeBoards(boards)
+        a = self.getActions(boards)
+        # iterate until every game is over
+        step = 0
+        while len(boards):
+            step += 1
+            rows = np.arange(len(boards))
+            boards[rows, a] = AGENT
+            won = hasWon(boards, AGENT)
+            over = won | isFull(boards)
+            reward = won.astype(np.int64)
+            live = np.flatnonzero(~over)
+            if len(live):
+                moves = self.teacher.makeMoves(boards[live], rng)
+                boards[live, moves] = TEACHER
+                lost = hasWon(boards[live], TEACHER)
+                reward[live] -= lost
+                over[live] = lost | isFull(boards[live])
+            # terminal updates for the games that just ended
+            if over.any():
+                self.update(s[over], a[over], reward[over])
+                if self.agent.episode_log is not None:
+                    # every game has made the same number of agent moves
+                    self.agent.episode_log.recordMany(
+                        reward[over], np.full(over.sum(), step))
+            # continuing games: determine new action and update Q-values
+            boards = boards[~over]
+            if not len(boards):
+                break
+            s_ = encodeBoards(boards)
+            a_ = self.getActions(boards)
+            self.update(s[~over], a[~over], reward[~over], s_, boards, a_)
+            s, a = s_, a_
+
+    def train(self, episodes):
+        """ Train the agent for the given number of episodes. """
+        played = 0
+        while played < episodes:
+            n = min(self.batch_size, episodes - played)
+            self.playBatch(n)
+            played += n
+        return played
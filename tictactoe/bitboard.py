@@ -0,0 +1,106 @@
+from tictactoe.game import Game
+
+
+# Cell (i,j) of the board corresponds to bit i*3 + j of a 9-bit mask.
+FULL_MASK = 0x1FF
+
+# The 8 lines that win the game: 3 rows, 3 columns and 2 diagonals.
+WIN_MASKS = (
+    0b000000111, 0b000111000, 0b111000000,
+    0b001001001, 0b010010010, 0b100100100,
+    0b100010001, 0b001010100,
+)
+
+# Lookup tables indexed by a 9-bit mask, computed once at import time.
+# WINNING[m] is True if mask m contains a complete line; MOVES[m] holds the
+# (i,j) positions of the bits that are set in m.
+WINNING = tuple(any(m & w == w for w in WIN_MASKS) for m in range(FULL_MASK+1))
+MOVES = tuple(tuple(divmod(p, 3) for p in range(9) if m >> p & 1)
+              for m in range(FULL_MASK+1))
+
+
+class BitBoard:
+    """
+    A tic-tac-toe board held as two 9-bit masks, one per player. The string
+    state key is kept up to date as moves are placed, so that it never has
+    to be rebuilt from the cells.
+    """
+    __slots__ = ('x', 'o', 'key')
+
+    def __init__(self):
+        self.x = 0
+        self.o = 0
+        self.key = '-'*9
+
+    def place(self, action, key):
+        """
+        Place token 'key' at position 'action'.
+
+        Parameters
+        ----------
+        action : (i,j) tuple
+            board position
+        key : string
+            token to place. Either 'O' or 'X'
+        """
+        p = action[0]*3 + action[1]
+        bit = 1 << p
+        # a token replaces whatever is on the cell, as on the list board
+        if key == 'X':
+            self.x |= bit
+            self.o &= ~bit
+        else:
+            self.o |= bit
+            self.x &= ~bit
+        self.key = self.key[:p] + key + self.key[p+1:]
+
+    def hasWon(self, key):
+        """ Check whether the player with token 'key' holds a full line. """
+        return WINNING[self.x if key == 'X' else self.o]
+
+    def isFull(self):
+        """ Check whether every cell of the board is taken. """
+        return self.x | self.o == FULL_MASK
+
+    def legalMoves(self):
+        """ Return a tuple of the (i,j) positions that are still empty. """
+        return MOVES[~(self.x | self.o) & FULL_MASK]
+
+    def toList(self):
+        """ Return the board in the list of lists layout used by Game. """
+        key = self.key
+        return [list(key[0:3]), list(key[3:6]), list(key[6:9])]
+
+
+class BitGame(Game):
+    """
+    A Game whose board is held in a BitBoard. Win and draw checks are mask
+    lookups instead of scans over the cells. The 'board' attribute is still
+    available as a list of lists, so Teacher and printBoard work unchanged.
+    """
+    def setupBoard(self):
+        self.bits = BitBoard()
+
+    @property
+    def board(self):
+        return self.bits.toList()
+
+    def placeToken(self, action, key):
+        self.bits.place(action, key)
+
+    def stateKey(self):
+        return self.bits.key
+
+    def checkForWin(self, key):
+        return self.bits.hasWon(key)
+
+    def checkForDraw(self):
+        return self.bits.isFull()
+
+    def checkForEnd(self, key):
+        # the mask lookups are faster than the state index here
+        if self.bits.hasWon(key):
+            return 1
+        elif self.bits.isFull():
+            return 0
+        return -1
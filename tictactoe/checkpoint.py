@@ -0,0 +1,328 @@
+from array import array
+import json
+import os
+import pickle
+import struct
+import numpy as np
+
+from tictactoe import agent as agents
+from tictactoe.files import atomicOpen
+from tictactoe.metrics import RewardRing
+from tictactoe.qtable import DenseQTable, LazyQTable, TrackedQTable
+from tictactoe.symmetry import SymmetricQTable
+
+
+# Binary checkpoint layout:
+#   MAGIC (4 bytes) | version (uint32) | header length (uint64) |
+#   JSON header, space padded so the arrays start on a 64 byte boundary |
+#   raw Q array | raw rewards array
+# The header records the agent class and hyperparameters, and the dtype,
+# shape and file offset of each array.
+MAGIC = b'TTTQ'
+VERSION = 1
+ALIGN = 64
+_PREFIX = struct.Struct('<4sIQ')
+
+# Hyperparameters stored in the header and passed back to the constructor
+HYPERPARAMETERS = ('alpha', 'gamma', 'eps', 'eps_decay')
+# Further hyperparameters of the learners with eligibility traces
+TRACE_HYPERPARAMETERS = ('lam', 'trace', 'cutoff')
+# Further hyperparameters of the experience replay learner
+REPLAY_HYPERPARAMETERS = ('capacity', 'batch_size', 'replay_every', 'passes',
+                          'prioritized')
+
+
+def isCheckpoint(path):
+    """ Check whether the file at 'path' is a binary checkpoint. """
+    with open(path, 'rb') as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+def _aligned(n):
+    return -(-n // ALIGN) * ALIGN
+
+
+def saveCheckpoint(agent, path):
+    """
+    Save an agent as a binary checkpoint. The Q values are converted to a
+    dense array if the agent uses another table backend. The file is written
+    to a temporary path and renamed into place.
+
+    Every snapshot gets a new random generation stamp in its header. A
+    write-ahead log only applies to the snapshot whose stamp it carries
+    (see replayLog), so a log left over from an earlier snapshot of the
+    same path is ignored. Returns the stamp.
+
+    Parameters
+    ----------
+    agent : Learner
+        the agent to save
+    path : string
+        checkpoint file path
+    """
+    table = agent.Q
+    symmetric = isinstance(table, SymmetricQTable)
+    if symmetric:
+        table = table.table
+    if isinstance(table, LazyQTable) and table.max_states is not None:
+        # a checkpoint always loads as a dense table, without the cap
+        raise ValueError("A Q-table with a state cap cannot be saved as a "
+                         "binary checkpoint.")
+    if not isinstance(table, DenseQTable):
+        table = DenseQTable.fromTable(table)
+    q = np.ascontiguousarray(table.array)
+    rewards = np.asarray(agent.rewards, dtype=np.int8)
+
+    names = HYPERPARAMETERS
+    if isinstance(agent, agents.TraceLearner):
+        names += TRACE_HYPERPARAMETERS
+    if isinstance(agent, agents.ReplayQlearner):
+        names += REPLAY_HYPERPARAMETERS
+    header = {
+        'class': type(agent).__name__,
+        'params': {name: getattr(agent, name) for name in names},
+        'symmetric': symmetric,
+        'reward_capacity': getattr(agent.rewards, 'capacity', None),
+        'generation': os.urandom(_GENERATION_SIZE).hex(),
+    }
+    # Lay out the arrays after a header of sufficient (padded) size
+    arrays = {'Q': q, 'rewards': rewards}
+    for name, arr in arrays.items():
+        header[name] = {'dtype': arr.dtype.str, 'shape': list(arr.shape)}
+    size = _PREFIX.size + len(json.dumps(header)) + 64*len(arrays)
+    offset = _aligned(size)
+    for name, arr in arrays.items():
+        header[name]['offset'] = offset
+        offset = _aligned(offset + arr.nbytes)
+    text = json.dumps(header).encode('utf-8')
+    text += b' '*(header['Q']['offset'] - _PREFIX.size - len(text))
+
+    with atomicOpen(path) as f:
+        f.write(_PREFIX.pack(MAGIC, VERSION, len(text)))
+        f.write(text)
+        for name, arr in arrays.items():
+            f.seek(header[name]['offset'])
+            f.write(arr.tobytes())
+    return header['generation']
+
+
+def readHeader(path):
+    """ Read and return the JSON header of a binary checkpoint. """
+    with open(path, 'rb') as f:
+        magic, version, length = _PREFIX.unpack(f.read(_PREFIX.size))
+        if magic != MAGIC:
+            raise ValueError("%s is not an agent checkpoint." % path)
+        if version > VERSION:
+            raise ValueError("Unsupported checkpoint version %i." % version)
+        return json.loads(f.read(length).decode('utf-8'))
+
+
+def _readArray(path, info, mmap):
+    shape = tuple(info['shape'])
+    if mmap and np.prod(shape) > 0:
+        return np.memmap(path, dtype=info['dtype'], mode='r',
+                         offset=info['offset'], shape=shape)
+    with open(path, 'rb') as f:
+        f.seek(info['offset'])
+        return np.fromfile(f, dtype=info['dtype'],
+                           count=int(np.prod(shape))).reshape(shape)
+
+
+def loadCheckpoint(path, mmap=True):
+    """
+    Load an agent from a binary checkpoint.
+
+    Parameters
+    ----------
+    path : string
+        checkpoint file path
+    mmap : bool
+        if True, the Q values and rewards are read-only memory maps of the
+        file, shared between all processes that load it. Such an agent can
+        select actions but not learn. If False, the arrays are copied into
+        memory and the agent can continue training.
+    """
+    header = readHeader(path)
+    cls = getattr(agents, header['class'])
+    agent = cls(**header['params'])
+    q = _readArray(path, header['Q'], mmap)
+    agent.Q = DenseQTable(array=q)
+    if header['symmetric']:
+        agent.Q = SymmetricQTable(agent.Q)
+    rewards = _readArray(path, header['rewards'], mmap)
+    capacity = header.get('reward_capacity')
+    if mmap:
+        agent.rewards = rewards
+    elif capacity is not None:
+        # the saved rewards are the most recent ones, oldest first
+        agent.rewards = RewardRing(capacity)
+        agent.rewards.buffer[:len(rewards)] = rewards
+        agent.rewards.count = len(rewards)
+    else:
+        agent.rewards = array('b', rewards.tobytes())
+    if not mmap and os.path.isfile(path + WAL_SUFFIX):
+        replayLog(agent, path + WAL_SUFFIX, header.get('generation'))
+    return agent
+
+
+# Write-ahead log of an incremental checkpoint, stored at PATH.wal. It
+# starts with WAL_MAGIC and the generation stamp of its snapshot, followed
+# by a sequence of chunks, one per commit:
+#   n_entries (uint32) | n_rewards (uint32) | reward_start (uint64) |
+#   n_entries x (flat index uint32, value float64) | n_rewards x int8
+# Entries hold absolute Q values, and reward_start is the length of the
+# reward log before the chunk, so replaying a chunk twice has no effect.
+WAL_SUFFIX = '.wal'
+WAL_MAGIC = b'TTTW'
+_GENERATION_SIZE = 8
+_CHUNK = struct.Struct('<IIQ')
+_ENTRY = np.dtype([('index', '<u4'), ('value', '<f8')])
+
+
+def _baseTable(agent):
+    table = agent.Q
+    return table.table if isinstance(table, SymmetricQTable) else table
+
+
+def replayLog(agent, wal_path, generation=None):
+    """
+    Apply the chunks of a write-ahead log to an agent loaded from the
+    matching snapshot. A log stamped with another generation than the
+    snapshot's belongs to an older snapshot and is ignored; so is a
+    truncated final chunk (from a crash during a commit). Snapshots written
+    before the stamps were introduced have no generation, and their logs no
+    stamp.
+    """
+    flat = _baseTable(agent).array.reshape(-1)
+    with open(wal_path, 'rb') as f:
+        data = f.read()
+    pos = 0
+    if generation is not None:
+        stamp = WAL_MAGIC + bytes.fromhex(generation)
+        if not data.startswith(stamp):
+            return
+        pos = len(stamp)
+    while pos + _CHUNK.size <= len(data):
+        n_entries, n_rewards, start = _CHUNK.unpack_from(data, pos)
+        end = pos + _CHUNK.size + n_entries*_ENTRY.itemsize + n_rewards
+        if end > len(data):
+            break
+        entries = np.frombuffer(data, dtype=_ENTRY, count=n_entries,
+                                offset=pos + _CHUNK.size)
+        flat[entries['index']] = entries['value']
+        rewards = data[end - n_rewards:end]
+        if len(agent.rewards) == start:
+            agent.rewards.extend(array('b', rewards))
+        pos = end
+
+
+class IncrementalCheckpointer:
+    """
+    Saves an agent incrementally. Each commit appends only the Q values
+    that changed since the previous commit, and the new rewards, to a
+    write-ahead log next to the snapshot. Every 'compact_every' commits the
+    log is folded into a new full snapshot. loadCheckpoint replays the log
+    (unless memory-mapping), so the agent can be restored up to its last
+    commit after a crash at any point.
+
+    The agent must use a dense Q-table (possibly wrapped for symmetry); its
+    table is replaced by a TrackedQTable sharing the same array.
+
+    Parameters
+    ----------
+    agent : Learner
+        the agent to save
+    path : string
+        snapshot path. The log is written to path + '.wal'
+    compact_every : int
+        number of commits between full snapshots
+    """
+    def __init__(self, agent, path, compact_every=100):
+        base = _baseTable(agent)
+        if not isinstance(base, DenseQTable):
+            raise ValueError("Incremental checkpoints require the dense "
+                             "Q-table backend.")
+        tracked = TrackedQTable(base.array)
+        if isinstance(agent.Q, SymmetricQTable):
+            agent.Q.table = tracked
+        else:
+            agent.Q = tracked
+        self.agent = agent
+        self.table = tracked
+        self.path = path
+        self.wal_path = path + WAL_SUFFIX
+        self.compact_every = compact_every
+        self.commits = 0
+        self.n_rewards = len(agent.rewards)
+        self.compact()
+
+    def commit(self):
+        """ Append the changes since the last commit to the log. """
+        self._append()
+        self.commits += 1
+        if self.commits % self.compact_every == 0:
+            self.compact()
+
+    def _append(self):
+        dirty = self.table.takeDirty()
+        entries = np.empty(len(dirty), dtype=_ENTRY)
+        entries['index'] = dirty
+        entries['value'] = self.table.array.reshape(-1)[dirty]
+        start = self.n_rewards
+        if isinstance(self.agent.rewards, array):
+            rewards = self.agent.rewards[start:].tobytes()
+        else:
+            # a RewardRing is only saved with the snapshots
+            rewards = b''
+        with open(self.wal_path, 'ab') as f:
+            f.write(_CHUNK.pack(len(entries), len(rewards), start))
+            f.write(entries.tobytes())
+            f.write(rewards)
+            f.flush()
+            os.fsync(f.fileno())
+        self.n_rewards += len(rewards)
+
+    def compact(self):
+        """ Write a full snapshot and start a new, empty log. """
+        # the snapshot holds every change so far; until the new log is
+        # written, the old one carries the previous stamp and is ignored
+        self.table.takeDirty()
+        generation = saveCheckpoint(self.agent, self.path)
+        with open(self.wal_path, 'wb') as f:
+            f.write(WAL_MAGIC + bytes.fromhex(generation))
+            f.flush()
+            os.fsync(f.fileno())
+        self.n_rewards = len(self.agent.rewards)
+
+    def close(self):
+        """ Commit the remaining changes and write a final snapshot. """
+        self.compact()
+
+
+def saveAgent(agent, path):
+    """
+    Save an agent, as a binary checkpoint if 'path' ends in '.ckpt' and as
+    a pickle otherwise.
+    """
+    if path.endswith('.ckpt'):
+        saveCheckpoint(agent, path)
+    else:
+        agent.save(path)
+
+
+def loadAgent(path, mmap=False):
+    """
+    Load an agent saved by saveAgent, detecting the file format.
+
+    Parameters
+    ----------
+    path : string
+        agent file path
+    mmap : bool
+        for binary checkpoints, whether to memory-map the arrays (see
+        loadCheckpoint)
+    """
+    if isCheckpoint(path):
+        return loadCheckpoint(path, mmap)
+    with open(path, 'rb') as f:
+        return pickle.load(f)
@@ -0,0 +1,198 @@
+import math
+import os
+
+from tictactoe.game import Game
+from tictactoe.players import AgentPlayer, RandomPlayer, TeacherPlayer
+from tictactoe.rng import makeStream, spawnSeeds
+from tictactoe.states import legalActions
+from tictactoe.teacher import PerfectTeacher, Teacher
+
+
+# Opponents when none are given
+DEFAULT_OPPONENTS = ('random', 'teacher:0.5', 'teacher:0.9', 'teacher:1.0',
+                     'perfect:1.0')
+
+# Games are played in blocks of this size, each with its own seed
+BLOCK_SIZE = 250
+
+# The actions of agents for the 3x3 game
+BOARD_ACTIONS = [(i, j) for i in range(3) for j in range(3)]
+
+
+def loadBoardAgent(path, mmap=True):
+    """
+    Load an agent saved by saveAgent (see checkpoint.loadAgent), and raise a
+    ValueError if it was trained on another board than the 3x3 one.
+    """
+    from tictactoe.checkpoint import loadAgent
+    agent = loadAgent(path, mmap)
+    if agent.actions != BOARD_ACTIONS:
+        raise ValueError("The agent at {} was trained on another board size "
+                         "(see the mnk command).".format(path))
+    return agent
+
+
+class GreedyAgent:
+    """
+    A frozen, greedy (epsilon = 0) view of a learner for evaluation games.
+    Ties between the best actions are broken at random; updates are ignored,
+    so the learner is never modified.
+
+    Parameters
+    ----------
+    agent : Learner
+        the trained agent
+    rng : RandomStream, Generator or seed
+        source of the tie-breaking random numbers (see rng.makeStream)
+    """
+    def __init__(self, agent, rng=None):
+        self.agent = agent
+        self.rng = makeStream(rng)
+
+    def get_action(self, s):
+        actions = legalActions(s)
+        values = list(self.agent.Q.values(s, actions))
+        best = max(values)
+        return self.rng.choice([a for a, v in zip(actions, values) if v == best])
+
+    def update(self, s, s_, a, a_, r):
+        pass
+
+
+def wilsonInterval(k, n, z=1.96):
+    """
+    Wilson score interval for a binomial proportion of k successes in n
+    trials. Returns (low, high); z = 1.96 gives a 95% interval.
+    """
+    if n == 0:
+        return 0., 1.
+    p = k/n
+    denom = 1. + z*z/n
+    center = (p + z*z/(2*n))/denom
+    half = z*math.sqrt(p*(1. - p)/n + z*z/(4*n*n))/denom
+    return max(0., center - half), min(1., center + half)
+
+
+def makeOpponent(spec, rng=None):
+    """
+    Create the player for an opponent spec:
+      'random'         uniformly random moves
+      'teacher:LEVEL'  the heuristic Teacher at the given ability level
+      'perfect:LEVEL'  the PerfectTeacher at the given ability level
+      'agent:PATH'     the greedy policy of the agent saved at PATH
+    The player draws its random numbers from 'rng' (see rng.makeStream).
+    """
+    kind, _, arg = spec.partition(':')
+    if kind == 'random':
+        return RandomPlayer(rng)
+    elif kind == 'teacher':
+        return TeacherPlayer(Teacher(float(arg or 0.9), rng))
+    elif kind == 'perfect':
+        return TeacherPlayer(PerfectTeacher(float(arg or 0.9), rng=rng))
+    elif kind == 'agent':
+        return AgentPlayer(loadBoardAgent(arg), rng)
+    raise ValueError("Unknown opponent '%s'." % spec)
+
+
+# The agent under evaluation, set in each worker by _initWorker
+_AGENT = None
+
+
+def _initWorker(agent):
+    global _AGENT
+    _AGENT = loadBoardAgent(agent) if isinstance(agent, str) else agent
+
+
+def playMatch(agent, player, n, game_class=Game):
+    """
+    Play n games of a (frozen) agent against a player. Returns the counts
+    of the agent's final rewards: {1: wins, 0: draws, -1: losses}.
+    """
+    counts = {1: 0, 0: 0, -1: 0}
+    for _ in range(n):
+        counts[game_class(agent, player=player).start()] += 1
+    return counts
+
+
+def _playGames(task):
+    """ Worker: play a block of games and count the agent's results. """
+    spec, n, seed = task
+    agent_rng, player_rng = makeStream(seed).spawn(2)
+    player = makeOpponent(spec, player_rng)
+    return spec, playMatch(GreedyAgent(_AGENT, agent_rng), player, n)
+
+
+def evaluate(agent, opponents=DEFAULT_OPPONENTS, games=1000, workers=None,
+             seed=None, z=1.96):
+    """
+    Play 'games' greedy games of an agent against each opponent, split over
+    a process pool. Every block of games gets its own seed derived from
+    'seed', so the results do not depend on the number of workers or on
+    scheduling.
+
+    Parameters
+    ----------
+    agent : Learner or string
+        the agent playing 'O', or the path of a saved agent
+    opponents : list of strings
+        opponent specs (see makeOpponent)
+    games : int
+        number of games against each opponent
+    workers : int
+        number of worker processes. Defaults to the number of CPUs
+    seed : int
+        seed from which the game seeds are derived
+    z : float
+        z-score of the confidence intervals
+
+    Returns a list with one dict per opponent, holding the number of games,
+    the win, draw and loss rates, and their Wilson confidence intervals.
+    """
+    # multiprocessing is imported here, not with the module, which play.py
+    # loads for its options
+    import multiprocessing as mp
+    workers = workers or os.cpu_count() or 1
+    # check the saved agents here, as errors in the workers would only
+    # surface once the games are played
+    if isinstance(agent, str):
+        loadBoardAgent(agent)
+    for spec in opponents:
+        if spec.startswith('agent:'):
+            loadBoardAgent(spec[len('agent:'):])
+    tasks = []
+    for spec in opponents:
+        for start in range(0, games, BLOCK_SIZE):
+            tasks.append([spec, min(BLOCK_SIZE, games - start)])
+    seeds = spawnSeeds(seed, len(tasks))
+    tasks = [(spec, n, s) for (spec, n), s in zip(tasks, seeds)]
+
+    ctx = mp.get_context('fork' if 'fork' in mp.get_all_start_methods()
+                         else None)
+    with ctx.Pool(workers, _initWorker, (agent,)) as pool:
+        outputs = pool.map(_playGames, tasks)
+    totals = {spec: {1: 0, 0: 0, -1: 0} for spec in opponents}
+    for spec, counts in outputs:
+        for r, k in counts.items():
+            totals[spec][r] += k
+
+    results = []
+    for spec in opponents:
+        counts = totals[spec]
+        result = {'opponent': spec, 'games': games}
+        for name, r in (('win', 1), ('draw', 0), ('loss', -1)):
+            result[name] = counts[r]/games
+            result[name + '_ci'] = wilsonInterval(counts[r], games, z)
+        results.append(result)
+    return results
+
+
+def formatResults(results):
+    """ Format evaluation results as a text table. """
+    lines = ['%-24s %7s   %-21s %-21s %s'
+             % ('opponent', 'games', 'win', 'draw', 'loss')]
+    for result in results:
+        cells = ['%.3f [%.3f, %.3f]' % ((result[name],) + result[name + '_ci'])
+                 for name in ('win', 'draw', 'loss')]
+        lines.append('%-24s %7i   %-21s %-21s %s'
+                     % ((result['opponent'], result['games']) + tuple(cells)))
+    return '\n'.join(lines)
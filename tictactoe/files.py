@@ -0,0 +1,37 @@
+import contextlib
+import os
+import tempfile
+
+
+@contextlib.contextmanager
+def atomicOpen(path, mode='wb'):
+    """
+    Open a temporary file next to 'path' for writing. When the block exits
+    without error, the file is flushed to disk and renamed over 'path', so
+    that readers only ever see the old or the complete new contents. On
+    error the temporary file is removed and 'path' is left untouched.
+
+    Parameters
+    ----------
+    path : string
+        destination file path
+    mode : string
+        file mode for the temporary file
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        # mkstemp creates the file private to the user; give it the
+        # permissions that open() would have
+        umask = os.umask(0)
+        os.umask(umask)
+        os.chmod(tmp_path, 0o666 & ~umask)
+        with os.fdopen(fd, mode) as f:
+            yield f
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
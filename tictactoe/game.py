@@ -1,43 +1,66 @@
-import random
+from tictactoe.players import HumanPlayer, TeacherPlayer, printBoard
+from tictactoe.states import gameResult
 
 
 class Game:
-    """ The game class. New instance created for each new game. """
-    def __init__(self, agent, teacher=None):
+    """
+    The game class. New instance created for each new game. The game engine
+    does no I/O itself; the opponent of the agent is a player object (see
+    players.py) that picks the 'X' moves, decides who moves first and is
+    told the result.
+
+    Parameters
+    ----------
+    agent : Learner
+        the RL agent, playing 'O'
+    teacher : Teacher
+        if given (and no player is), the opponent follows this teacher
+    player : player object
+        the opponent. Defaults to a TeacherPlayer when a teacher is given
+        and to a HumanPlayer otherwise
+    """
+    def __init__(self, agent, teacher=None, player=None):
         self.agent = agent
         self.teacher = teacher
+        if player is None:
+            player = HumanPlayer() if teacher is None else TeacherPlayer(teacher)
+        self.player = player
         # initialize the game board
+        self.setupBoard()
+
+    def setupBoard(self):
+        """ Create an empty game board. """
         self.board = [['-', '-', '-'], ['-', '-', '-'], ['-', '-', '-']]
 
     def playerMove(self):
         """
         Querry player for a move and update the board accordingly.
         """
-        if self.teacher is not None:
-            action = self.teacher.makeMove(self.board)
-            self.board[action[0]][action[1]] = 'X'
-        else:
-            printBoard(self.board)
-            while True:
-                move = input("Your move! Please select a row and column from 0-2 "
-                             "in the format row,col: ")
-                print('\n')
-                try:
-                    row, col = int(move[0]), int(move[2])
-                except ValueError:
-                    print("INVALID INPUT! Please use the correct format.")
-                    continue
-                if row not in range(3) or col not in range(3) or not self.board[row][col] == '-':
-                    print("INVALID MOVE! Choose again.")
-                    continue
-                self.board[row][col] = 'X'
-                break
+        action = self.player.makeMove(self.board)
+        self.placeToken(action, 'X')
 
     def agentMove(self, action):
         """
         Update board according to agent's move.
         """
-        self.board[action[0]][action[1]] = 'O'
+        self.placeToken(action, 'O')
+
+    def placeToken(self, action, key):
+        """
+        Place token 'key' on the board at position 'action'.
+
+        Parameters
+        ----------
+        action : (i,j) tuple
+            board position
+        key : string
+            token to place. Either 'O' or 'X'
+        """
+        self.board[action[0]][action[1]] = key
+
+    def stateKey(self):
+        """ Return the string key for the current board state. """
+        return getStateKey(self.board)
 
     def checkForWin(self, key):
         """
@@ -85,18 +108,11 @@ class Game:
         key : string
             token of most recent player. Either 'O' or 'X'
         """
-        if self.checkForWin(key):
-            if self.teacher is None:
-                printBoard(self.board)
-                if key == 'X':
-                    print("Player wins!")
-                else:
-                    print("RL agent wins!")
+        # look the outcome up in the precomputed state index
+        result = gameResult(self.stateKey())
+        if result == key:
             return 1
-        elif self.checkForDraw():
-            if self.teacher is None:
-                printBoard(self.board)
-                print("It's a draw!")
+        elif result == '-':
             return 0
         return -1
 
@@ -110,11 +126,13 @@ class Game:
             Whether or not the player will move first. If False, the
             agent goes first.
 
+        Returns the agent's final reward: 1 for a win, 0 for a draw and
+        -1 for a loss.
         """
         # Initialize the agent's state and action
         if player_first:
             self.playerMove()
-        prev_state = getStateKey(self.board)
+        prev_state = self.stateKey()
         prev_action = self.agent.get_action(prev_state)
 
         # iterate until game is over
@@ -125,17 +143,19 @@ class Game:
             if not check == -1:
                 # game is over. +1 reward if win, 0 if draw
                 reward = check
+                winner = 'O' if check == 1 else None
                 break
             self.playerMove()
             check = self.checkForEnd('X')
             if not check == -1:
                 # game is over. -1 reward if lose, 0 if draw
                 reward = -1*check
+                winner = 'X' if check == 1 else None
                 break
             else:
                 # game continues. 0 reward
                 reward = 0
-            new_state = getStateKey(self.board)
+            new_state = self.stateKey()
 
             # determine new action (epsilon-greedy)
             new_action = self.agent.get_action(new_state)
@@ -148,48 +168,18 @@ class Game:
 
         # Game over. Perform final update
         self.agent.update(prev_state, None, prev_action, None, reward)
+        self.player.gameOver(self.board, winner)
+        return reward
 
     def start(self):
         """
         Function to determine who moves first, and subsequently, start the game.
-        If a teacher is employed, first mover is selected at random.
-        If a human is playing, the human is asked whether he/she would
-        like to move fist. 
+        The player decides who moves first: with a teacher, first mover is
+        selected at random; a human is asked whether he/she would like to
+        move fist. Returns the agent's final reward.
         """
-        if self.teacher is not None:
-            # During teaching, chose who goes first randomly with equal probability
-            if random.random() < 0.5:
-                self.playGame(player_first=False)
-            else:
-                self.playGame(player_first=True)
-        else:
-            while True:
-                response = input("Would you like to go first? [y/n]: ")
-                print('')
-                if response == 'n' or response == 'no':
-                    self.playGame(player_first=False)
-                    break
-                elif response == 'y' or response == 'yes':
-                    self.playGame(player_first=True)
-                    break
-                else:
-                    print("Invalid input. Please enter 'y' or 'n'.")
-
-def printBoard(board):
-    """
-    Prints the game board as text output to the terminal.
+        return self.playGame(player_first=self.player.goesFirst())
 
-    Parameters
-    ----------
-    board : list of lists
-        the current game board
-    """
-    print('    0   1   2\n')
-    for i, row in enumerate(board):
-        print('%i   ' % i, end='')
-        for elt in row:
-            print('%s   ' % elt, end='')
-        print('\n')
 
 def getStateKey(board):
     """
@@ -0,0 +1,84 @@
+import numpy as np
+
+from tictactoe.batch import EMPTY, POWERS, encodeBoards, selectActions
+from tictactoe.qtable import DenseQTable, N_CELLS, N_STATES, decodeState, encodeState
+from tictactoe.symmetry import SymmetricQTable, canonicalActions
+
+
+def denseValues(table):
+    """
+    Return a (3^9, 9) array of Q values in board coordinates for any
+    Q-table. A plain dense table's own array is returned without copying;
+    other tables are converted once.
+    """
+    if isinstance(table, SymmetricQTable):
+        canonical = denseValues(table.table)
+        codes = np.empty(N_STATES, dtype=np.int64)
+        cells = np.empty((N_STATES, N_CELLS), dtype=np.int64)
+        for code in range(N_STATES):
+            c, m = canonicalActions(decodeState(code))
+            codes[code] = encodeState(c)
+            cells[code] = [i*3 + j for i, j in m]
+        return canonical[codes[:, None], cells]
+    if not isinstance(table, DenseQTable):
+        table = DenseQTable.fromTable(table)
+    return table.array
+
+
+def legalMask(codes):
+    """ Boolean (N,9) mask of the empty cells of each encoded board. """
+    codes = np.asarray(codes, dtype=np.int64)
+    return (codes[:, None] // POWERS) % 3 == EMPTY
+
+
+class Policy:
+    """
+    Read-only, vectorized move selection for a trained agent. Moves for
+    many boards are chosen in one pass: illegal moves are masked, ties
+    between the best moves are broken at random, and the agent's Q values
+    and epsilon are never modified.
+
+    Parameters
+    ----------
+    agent : Learner
+        the trained agent. For a dense (non-symmetric) agent, the policy reads
+        the agent's own array, so it also works on a memory-mapped checkpoint
+        without copying
+    eps : float
+        probability of a random move instead of the greedy one
+    seed : int
+        seed for the policy's random number generator
+    """
+    def __init__(self, agent, eps=0., seed=None):
+        self.values = denseValues(agent.Q)
+        self.eps = eps
+        self.rng = np.random.default_rng(seed)
+
+    def act(self, codes, eps=None):
+        """
+        Choose a move for each board.
+
+        Parameters
+        ----------
+        codes : int array
+            boards encoded with qtable.encodeState
+        eps : float
+            overrides the policy's epsilon for this call
+
+        Returns an int array of flat cell indices (row*3 + col).
+        """
+        codes = np.asarray(codes, dtype=np.int64)
+        return selectActions(self.values[codes], legalMask(codes),
+                             self.eps if eps is None else eps, self.rng)
+
+    def actBoards(self, boards, eps=None):
+        """
+        Choose a move for each row of an (N,9) array of boards holding
+        0 for empty cells, 1 for 'O' (the agent) and 2 for 'X'.
+        """
+        return self.act(encodeBoards(np.asarray(boards)), eps)
+
+    def actKeys(self, keys, eps=None):
+        """ Choose an (i,j) move for each state string in 'keys'. """
+        cells = self.act([encodeState(s) for s in keys], eps)
+        return [divmod(int(c), 3) for c in cells]
@@ -0,0 +1,214 @@
+import cProfile
+import io
+import json
+import pstats
+import time
+import tracemalloc
+
+
+# Phases of a training step that are timed separately
+PHASES = ('action', 'teacher', 'checks', 'update')
+
+
+class Instrumentation:
+    """
+    Collects training metrics: time spent in each phase of a step, episodes
+    per second, Q-table size and growth, epsilon, and win/draw/loss rates.
+    Every 'report_every' episodes a report dict is built and passed to each
+    registered hook (see addHook and JsonLinesWriter).
+
+    Instrumentation is opt-in: games only pay for the timers when they are
+    created with instrumentedGameClass.
+
+    Parameters
+    ----------
+    agent : Learner
+        the agent being trained
+    report_every : int
+        number of episodes between reports
+    """
+    def __init__(self, agent, report_every=1000):
+        self.agent = agent
+        self.report_every = report_every
+        self.hooks = []
+        self.episodes = 0
+        self.outcomes = {1: 0, 0: 0, -1: 0}
+        self.phase_time = dict.fromkeys(PHASES, 0.)
+        self.phase_calls = dict.fromkeys(PHASES, 0)
+        self.start_time = time.perf_counter()
+        self.last_time = self.start_time
+        self.last_episodes = 0
+        self.last_outcomes = dict(self.outcomes)
+        self.last_size = agent.Q.size()
+
+    def addHook(self, hook):
+        """ Register a function that is called with every report dict. """
+        self.hooks.append(hook)
+
+    def addPhaseTime(self, phase, seconds):
+        self.phase_time[phase] += seconds
+        self.phase_calls[phase] += 1
+
+    def episodeEnd(self, reward):
+        """
+        Record the agent's final reward for a finished episode, and emit a
+        report when one is due.
+        """
+        self.episodes += 1
+        self.outcomes[reward] += 1
+        if self.episodes % self.report_every == 0:
+            self.report()
+
+    def report(self):
+        """ Build a report of the metrics and pass it to the hooks. """
+        now = time.perf_counter()
+        window = self.episodes - self.last_episodes
+        size = self.agent.Q.size()
+
+        def rates(outcomes, n):
+            n = max(n, 1)
+            return {'win': outcomes[1]/n, 'draw': outcomes[0]/n,
+                    'loss': outcomes[-1]/n}
+
+        recent = {k: v - self.last_outcomes[k] for k, v in self.outcomes.items()}
+        report = {
+            'episodes': self.episodes,
+            'elapsed': now - self.start_time,
+            'episodes_per_sec': window/max(now - self.last_time, 1e-9),
+            'qtable_size': size,
+            'qtable_growth': size - self.last_size,
+            'epsilon': self.agent.eps,
+            'rates': rates(recent, window),
+            'total_rates': rates(self.outcomes, self.episodes),
+            'phase_seconds': dict(self.phase_time),
+            'phase_calls': dict(self.phase_calls),
+        }
+        # tables that keep usage statistics (see qtable.LazyQTable)
+        table = getattr(self.agent.Q, 'table', self.agent.Q)
+        if hasattr(table, 'stats'):
+            report['qtable_stats'] = table.stats()
+        self.last_time = now
+        self.last_episodes = self.episodes
+        self.last_outcomes = dict(self.outcomes)
+        self.last_size = size
+        for hook in self.hooks:
+            hook(report)
+        return report
+
+
+class JsonLinesWriter:
+    """
+    A report hook that appends each report as one JSON line to a file.
+
+    Parameters
+    ----------
+    path : string
+        output file path
+    """
+    def __init__(self, path):
+        self.file = open(path, 'a')
+
+    def __call__(self, report):
+        self.file.write(json.dumps(report) + '\n')
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+class TimedAgent:
+    """
+    Wraps a learner so that the time spent selecting actions and updating
+    Q values is recorded. Other attributes are passed through.
+    """
+    def __init__(self, agent, instrument):
+        self.agent = agent
+        self.instrument = instrument
+
+    def __getattr__(self, name):
+        return getattr(self.agent, name)
+
+    def get_action(self, s):
+        t = time.perf_counter()
+        action = self.agent.get_action(s)
+        self.instrument.addPhaseTime('action', time.perf_counter() - t)
+        return action
+
+    def update(self, s, s_, a, a_, r):
+        t = time.perf_counter()
+        self.agent.update(s, s_, a, a_, r)
+        self.instrument.addPhaseTime('update', time.perf_counter() - t)
+
+
+class InstrumentedGameMixin:
+    """
+    Mixin for Game classes that times the teacher's moves and the end of
+    game checks, and passes the agent through a TimedAgent. Classes are
+    created with instrumentedGameClass.
+    """
+    instrument = None
+
+    def __init__(self, agent, teacher=None, player=None):
+        super().__init__(TimedAgent(agent, self.instrument), teacher, player)
+
+    def playerMove(self):
+        t = time.perf_counter()
+        super().playerMove()
+        self.instrument.addPhaseTime('teacher', time.perf_counter() - t)
+
+    def checkForEnd(self, key):
+        t = time.perf_counter()
+        check = super().checkForEnd(key)
+        self.instrument.addPhaseTime('checks', time.perf_counter() - t)
+        return check
+
+    def start(self):
+        reward = super().start()
+        self.instrument.episodeEnd(reward)
+        return reward
+
+
+def instrumentedGameClass(game_class, instrument):
+    """
+    Create a subclass of 'game_class' (Game or BitGame) whose games report
+    their timings and results to 'instrument'.
+    """
+    return type('Instrumented' + game_class.__name__,
+                (InstrumentedGameMixin, game_class), {'instrument': instrument})
+
+
+def profileRun(fn, prefix, top=30):
+    """
+    Run fn() under cProfile and tracemalloc. The profile is dumped to
+    PREFIX.prof (readable with pstats or snakeviz) and a text summary of the
+    slowest functions and largest allocation sites to PREFIX.txt.
+
+    Parameters
+    ----------
+    fn : callable
+        the function to run
+    prefix : string
+        path prefix of the output files
+    top : int
+        number of entries in each section of the text summary
+    """
+    profiler = cProfile.Profile()
+    tracemalloc.start()
+    profiler.enable()
+    try:
+        return fn()
+    finally:
+        profiler.disable()
+        snapshot = tracemalloc.take_snapshot()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        profiler.dump_stats(prefix + '.prof')
+        out = io.StringIO()
+        stats = pstats.Stats(profiler, stream=out)
+        stats.sort_stats('cumulative').print_stats(top)
+        out.write('Peak traced memory: %i bytes\n\n' % peak)
+        out.write('Top allocation sites:\n')
+        for stat in snapshot.statistics('lineno')[:top]:
+            out.write('%s\n' % stat)
+        with open(prefix + '.txt', 'w') as f:
+            f.write(out.getvalue())
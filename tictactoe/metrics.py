@@ -0,0 +1,135 @@
+from array import array
+
+
+class RewardRing:
+    """
+    A fixed-capacity reward log that keeps only the most recent rewards.
+    Supports the list operations used by the learners (append, extend, len)
+    and converts to a NumPy array in chronological order.
+
+    Parameters
+    ----------
+    capacity : int
+        maximum number of rewards held
+    """
+    def __init__(self, capacity):
+        # NumPy is imported on use, so that unbounded logs never need it
+        import numpy as np
+        self.buffer = np.zeros(capacity, dtype=np.int8)
+        self.capacity = capacity
+        # total number of rewards ever appended
+        self.count = 0
+
+    def append(self, r):
+        self.buffer[self.count % self.capacity] = r
+        self.count += 1
+
+    def extend(self, rewards):
+        for r in rewards:
+            self.append(r)
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    def __array__(self, dtype=None, copy=None):
+        import numpy as np
+        start = self.count % self.capacity
+        if self.count <= self.capacity:
+            out = self.buffer[:self.count].copy()
+        else:
+            out = np.concatenate([self.buffer[start:], self.buffer[:start]])
+        return out if dtype is None else out.astype(dtype)
+
+    def __iter__(self):
+        return iter(self.__array__().tolist())
+
+
+def makeRewardLog(capacity=None):
+    """
+    Create a reward log for a learner: an unbounded array of signed bytes
+    (1 byte per reward), or a RewardRing if 'capacity' is given.
+    """
+    if capacity is None:
+        return array('b')
+    return RewardRing(capacity)
+
+
+class EpisodeLog:
+    """
+    Streams per-episode aggregates to an append-only CSV file with columns
+    'reward,length', where reward is the final reward of the episode
+    (1 win, 0 draw, -1 loss) and length is the number of agent moves.
+    Rows are buffered and written in chunks.
+
+    Parameters
+    ----------
+    path : string
+        CSV file path. Rows are appended if the file exists
+    chunk_size : int
+        number of episodes buffered before writing
+    """
+    def __init__(self, path, chunk_size=4096):
+        self.path = path
+        self.chunk_size = chunk_size
+        self.buffer = []
+        self.file = None
+
+    def __getstate__(self):
+        # pickle only the settings; buffered rows are written first
+        self.flush()
+        return {'path': self.path, 'chunk_size': self.chunk_size}
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    def record(self, reward, length):
+        """ Log one finished episode. """
+        self.buffer.append('%i,%i\n' % (reward, length))
+        if len(self.buffer) >= self.chunk_size:
+            self.flush()
+
+    def recordMany(self, rewards, lengths):
+        """ Log several finished episodes given as arrays. """
+        self.buffer.extend('%i,%i\n' % (r, n) for r, n in zip(rewards.tolist(),
+                                                           lengths.tolist()))
+        if len(self.buffer) >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        """ Write the buffered rows to the file. """
+        if not self.buffer:
+            return
+        if self.file is None:
+            self.file = open(self.path, 'a')
+        self.file.write(''.join(self.buffer))
+        self.file.flush()
+        self.buffer = []
+
+    def close(self):
+        self.flush()
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+def readEpisodeLog(path, chunk_size=65536):
+    """
+    Read an episode log incrementally. Yields (rewards, lengths) arrays of
+    at most 'chunk_size' episodes each, so that logs of any size can be
+    processed in bounded memory.
+
+    Parameters
+    ----------
+    path : string
+        CSV file written by EpisodeLog
+    chunk_size : int
+        maximum number of episodes per chunk
+    """
+    import numpy as np
+    with open(path) as f:
+        while True:
+            lines = [line for _, line in zip(range(chunk_size), f)]
+            if not lines:
+                return
+            data = np.loadtxt(lines, delimiter=',', dtype=np.int64, ndmin=2)
+            yield data[:, 0], data[:, 1]
@@ -0,0 +1,261 @@
+import numpy as np
+
+from tictactoe.rng import makeStream
+
+
+# Directions of the lines through a cell, as (row step, column step): along
+# a row, along a column and along both diagonals
+DIRECTIONS = ((0, 1), (1, 0), (1, 1), (1, -1))
+
+
+def rayTable(m, n, k):
+    """
+    Precompute, for each cell of an m x n board, the cells that can be in a
+    line of k with it. For each direction, a pair of tuples holds the (up
+    to k-1) cells that follow the cell in that direction and those that
+    precede it, nearest first. Directions in which no line of k fits are
+    left out. A move can only complete lines through its own cell, so these
+    are the only cells a win check after a move has to look at.
+    """
+    rays = []
+    for p in range(m*n):
+        i, j = divmod(p, n)
+        pairs = []
+        for di, dj in DIRECTIONS:
+            pair = []
+            for sign in (1, -1):
+                cells = []
+                for step in range(1, k):
+                    r, c = i + sign*step*di, j + sign*step*dj
+                    if not (0 <= r < m and 0 <= c < n):
+                        break
+                    cells.append(r*n + c)
+                pair.append(tuple(cells))
+            if len(pair[0]) + len(pair[1]) >= k - 1:
+                pairs.append(tuple(pair))
+        rays.append(tuple(pairs))
+    return tuple(rays)
+
+
+def zobristTable(n_cells, seed=0):
+    """
+    Random 64-bit keys for each (cell, token) pair. The key of a board is
+    the XOR of the keys of its tokens, so a move updates it with a single
+    XOR. Two distinct boards share a key with probability 2^-64. The keys
+    come from a fixed seed, so that Q-tables keyed by them stay valid when
+    an agent is saved and loaded.
+    """
+    rng = np.random.default_rng(seed)
+    keys = rng.integers(0, 2**64, size=(n_cells, 2), dtype=np.uint64)
+    return tuple({'O': o, 'X': x} for o, x in keys.tolist())
+
+
+class MNKRules:
+    """
+    The rules of an m,n,k game: players take turns placing tokens on an
+    m x n board, and the first to hold k in a row (horizontally, vertically
+    or diagonally) wins. Tic-tac-toe is the 3,3,3 game. The line and key
+    tables are computed once here and shared by every board.
+
+    Parameters
+    ----------
+    m : int
+        number of rows
+    n : int
+        number of columns
+    k : int
+        number of tokens in a row that wins
+    seed : int
+        seed of the Zobrist keys (see zobristTable)
+    """
+    def __init__(self, m=3, n=3, k=3, seed=0):
+        if not 2 <= k <= max(m, n):
+            raise ValueError("The win length must be between 2 and the "
+                             "longest side of the board.")
+        self.m = m
+        self.n = n
+        self.k = k
+        self.rays = rayTable(m, n, k)
+        self.zobrist = zobristTable(m*n, seed)
+        # actions are (i,j) tuples, as for the 3x3 game
+        self.actions = [(i, j) for i in range(m) for j in range(n)]
+        # squared distance of each cell from the center of the board
+        self.centrality = [(i - (m-1)/2)**2 + (j - (n-1)/2)**2
+                           for i, j in self.actions]
+
+
+class MNKBoard:
+    """
+    An m,n,k board held as a flat list of cells ('-', 'O' or 'X'). Its
+    Zobrist key is updated with each move, and a win check after a move
+    only follows the lines through the cell that was taken.
+
+    Parameters
+    ----------
+    rules : MNKRules
+        the board size and win length
+    """
+    __slots__ = ('rules', 'cells', 'key', 'empty')
+
+    def __init__(self, rules):
+        self.rules = rules
+        self.cells = ['-']*(rules.m*rules.n)
+        self.key = 0
+        self.empty = len(self.cells)
+
+    def place(self, action, token):
+        """
+        Place 'token' ('O' or 'X') at the (i,j) position 'action'. Returns
+        True if the move wins the game.
+        """
+        p = action[0]*self.rules.n + action[1]
+        self.cells[p] = token
+        self.key ^= self.rules.zobrist[p][token]
+        self.empty -= 1
+        return self.completesLine(p, token)
+
+    def completesLine(self, p, token):
+        """
+        Check whether 'token' on cell p (whether or not it is there yet)
+        makes k in a row.
+        """
+        cells = self.cells
+        need = self.rules.k - 1
+        for forward, backward in self.rules.rays[p]:
+            run = 0
+            for q in forward:
+                if cells[q] != token:
+                    break
+                run += 1
+            for q in backward:
+                if cells[q] != token:
+                    break
+                run += 1
+            if run >= need:
+                return True
+        return False
+
+    def isFull(self):
+        """ Check whether every cell of the board is taken. """
+        return self.empty == 0
+
+    def legalMoves(self):
+        """ Return a list of the (i,j) positions that are still empty. """
+        actions = self.rules.actions
+        return [actions[p] for p, c in enumerate(self.cells) if c == '-']
+
+    def toList(self):
+        """ Return the board as a list of rows (see players.printBoard). """
+        n = self.rules.n
+        return [self.cells[i*n:(i+1)*n] for i in range(self.rules.m)]
+
+
+class MNKTeacher:
+    """
+    An opponent for m,n,k games, playing 'X'. With probability
+    'ability_level' it follows a short strategy hierarchy: complete a line
+    of its own if it can, else block one of the agent's, else take the free
+    cell closest to the center (ties broken at random). Otherwise it plays a
+    random legal move. As the players in players.py, it also decides who
+    moves first (at random) and is told the result.
+
+    Parameters
+    ----------
+    ability_level : float
+        probability that the strategy is followed
+    rng : RandomStream, Generator or seed
+        source of the teacher's random numbers (see rng.makeStream)
+    """
+    def __init__(self, ability_level=0.9, rng=None):
+        self.ability_level = ability_level
+        self.rng = makeStream(rng)
+
+    def goesFirst(self):
+        return self.rng.random() >= 0.5
+
+    def makeMove(self, board):
+        """ Choose an (i,j) move on an MNKBoard. """
+        moves = board.legalMoves()
+        if self.rng.random() > self.ability_level:
+            return self.rng.choice(moves)
+        n = board.rules.n
+        cells = [i*n + j for i, j in moves]
+        for token in ('X', 'O'):
+            for p, move in zip(cells, moves):
+                if board.completesLine(p, token):
+                    return move
+        centrality = board.rules.centrality
+        best = min(centrality[p] for p in cells)
+        return self.rng.choice([move for p, move in zip(cells, moves)
+                                if centrality[p] == best])
+
+    def gameOver(self, board, key):
+        pass
+
+
+class MNKGame:
+    """
+    A game of the agent ('O') against a player ('X') on an m,n,k board.
+    The game loop is that of game.Game, but states are the boards' Zobrist
+    keys (ints) and the legal moves are passed to the agent along with
+    them. The agent needs the board's action set and a table that accepts
+    any state key, e.g.
+
+        Qlearner(alpha, gamma, eps, backend='sparse', actions=rules.actions)
+
+    Parameters
+    ----------
+    agent : Learner
+        the RL agent, playing 'O'
+    player : player object
+        the opponent, e.g. an MNKTeacher. Its makeMove gets the MNKBoard
+    rules : MNKRules
+        the board size and win length
+    """
+    def __init__(self, agent, player, rules):
+        self.agent = agent
+        self.player = player
+        self.board = MNKBoard(rules)
+
+    def playGame(self, player_first):
+        """
+        Play one game. Returns the agent's final reward: 1 for a win, 0 for
+        a draw and -1 for a loss.
+        """
+        board = self.board
+        agent = self.agent
+        if player_first:
+            board.place(self.player.makeMove(board), 'X')
+        prev_state = board.key
+        prev_action = agent.get_action(prev_state, board.legalMoves())
+
+        # iterate until game is over
+        while True:
+            if board.place(prev_action, 'O'):
+                reward, winner = 1, 'O'
+                break
+            if board.isFull():
+                reward, winner = 0, None
+                break
+            if board.place(self.player.makeMove(board), 'X'):
+                reward, winner = -1, 'X'
+                break
+            if board.isFull():
+                reward, winner = 0, None
+                break
+            new_state = board.key
+            moves = board.legalMoves()
+            new_action = agent.get_action(new_state, moves)
+            agent.update(prev_state, new_state, prev_action, new_action, 0,
+                         moves)
+            prev_state = new_state
+            prev_action = new_action
+
+        # Game over. Perform final update
+        agent.update(prev_state, None, prev_action, None, reward)
+        self.player.gameOver(board, winner)
+        return reward
+
+    def start(self):
+        """ Let the player decide who moves first, then play the game. """
+        return self.playGame(player_first=self.player.goesFirst())
@@ -0,0 +1,262 @@
+import os
+import threading
+import time
+
+from tictactoe.game import Game
+from tictactoe.metrics import makeRewardLog
+from tictactoe.qtable import DenseQTable, N_CELLS, N_STATES, encodeState
+from tictactoe.rng import makeStream
+
+
+MERGE_POLICIES = ('mean', 'sum', 'visits')
+
+
+class CountingQTable(DenseQTable):
+    """
+    A dense Q-table that also counts the updates made to each state-action
+    pair, for visit-weighted merging of worker tables.
+    """
+    def __init__(self, visits):
+        super().__init__()
+        self.visits = visits
+
+    def add(self, s, a, delta):
+        super().add(s, a, delta)
+        self.visits[encodeState(s), a[0]*3 + a[1]] += 1
+
+
+def _attach(name, shape, dtype):
+    """ Attach to a shared memory block and view it as an array. """
+    import numpy as np
+    from multiprocessing import shared_memory
+    shm = shared_memory.SharedMemory(name=name)
+    return shm, np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+
+
+def _worker(rank, agent, teacher, game_class, schedule, names, n_workers,
+            merge, seed, barrier, results, timeout):
+    """
+    Worker process main loop. At the start of each round, copy the shared
+    table into the local agent, play this worker's share of episodes, then
+    write the change in Q values (and visit counts) to this worker's slot.
+    If the worker fails, it breaks the barrier so that the coordinator and
+    the other workers stop waiting for it.
+    """
+    try:
+        _workerRounds(rank, agent, teacher, game_class, schedule, names,
+                      n_workers, merge, seed, barrier, results, timeout)
+    except threading.BrokenBarrierError:
+        # another process failed and has already reported it
+        pass
+    except BaseException:
+        barrier.abort()
+        raise
+
+
+def _workerRounds(rank, agent, teacher, game_class, schedule, names, n_workers,
+                  merge, seed, barrier, results, timeout):
+    import numpy as np
+    agent.rng, teacher.rng = makeStream(seed).spawn(2)
+    # the agent arrives with its reward history; only report new rewards
+    agent.rewards = makeRewardLog()
+    shape = (N_STATES, N_CELLS)
+    blocks = [_attach(names['table'], shape, np.float64),
+              _attach(names['deltas'], (n_workers,) + shape, np.float64)]
+    table, deltas = blocks[0][1], blocks[1][1]
+    if merge == 'visits':
+        blocks.append(_attach(names['visits'], (n_workers,) + shape, np.int64))
+        agent.Q = CountingQTable(blocks[2][1][rank])
+    for episodes in schedule:
+        # wait for the coordinator to publish the merged table
+        barrier.wait(timeout)
+        agent.Q.array[:] = table
+        if merge == 'visits':
+            agent.Q.visits[:] = 0
+        for _ in range(episodes):
+            game = game_class(agent, teacher=teacher)
+            game.start()
+        np.subtract(agent.Q.array, table, out=deltas[rank])
+        # signal that this worker's deltas are ready
+        barrier.wait(timeout)
+    if agent.episode_log is not None:
+        agent.episode_log.flush()
+    results.put((rank, agent.rewards, agent.eps))
+    del table, deltas
+    for shm, _ in blocks:
+        shm.close()
+
+
+def _meet(barrier, procs, timeout):
+    """
+    Wait at the barrier for all workers, as the coordinator. Raises
+    BrokenBarrierError as soon as a worker has exited, the barrier was
+    broken or 'timeout' seconds have passed, so that a worker killed from
+    outside (which cannot break the barrier) does not hang training.
+    """
+    deadline = time.monotonic() + timeout
+    while barrier.n_waiting < len(procs):
+        if (barrier.broken or time.monotonic() > deadline
+                or any(p.exitcode is not None for p in procs)):
+            raise threading.BrokenBarrierError
+        time.sleep(0.005)
+    barrier.wait(timeout)
+
+
+class ParallelTrainer:
+    """
+    Trains an agent against a teacher in several worker processes. Each
+    worker plays Game episodes with its own copy of the agent. Every
+    'sync_interval' episodes per worker, the coordinator merges the changes
+    of all workers into a shared Q-table and the workers continue from it.
+    The shared table and the per-worker deltas live in shared memory, so
+    no Q values are pickled during training.
+
+    Parameters
+    ----------
+    agent : Learner
+        the agent to train. Must use the dense Q-table backend
+    teacher : Teacher
+        the opponent
+    workers : int
+        number of worker processes. Defaults to the number of CPUs
+    sync_interval : int
+        episodes each worker plays between merges
+    merge : string
+        how worker updates are combined. 'mean' averages the deltas, 'sum'
+        adds them, and 'visits' averages them weighted by the number of
+        updates each worker made to each state-action pair
+    game_class : class
+        Game or a subclass of it (e.g. BitGame)
+    seed : int
+        seed from which the worker seeds are derived. Every call of train
+        spawns new worker seeds, so successive calls do not repeat each
+        other's games
+    timeout : float
+        seconds the coordinator and the workers wait for each other at a
+        merge before training is abandoned. Must exceed the time a worker
+        takes for one round
+    """
+    def __init__(self, agent, teacher, workers=None, sync_interval=1000,
+                 merge='mean', game_class=Game, seed=None, timeout=3600.):
+        if not isinstance(agent.Q, DenseQTable):
+            raise ValueError("Parallel training requires the dense Q-table "
+                             "backend.")
+        if merge not in MERGE_POLICIES:
+            raise ValueError("Unknown merge policy '%s'." % merge)
+        # NumPy and multiprocessing are imported here rather than with the
+        # module, which play.py loads for its options
+        import numpy as np
+        self.agent = agent
+        self.teacher = teacher
+        self.workers = workers or os.cpu_count() or 1
+        self.sync_interval = sync_interval
+        self.merge = merge
+        self.game_class = game_class
+        self.seed = np.random.SeedSequence(seed)
+        self.timeout = timeout
+
+    def schedule(self, episodes):
+        """ Episodes per round for each worker, covering 'episodes' total. """
+        k = self.workers
+        per_round = k*self.sync_interval
+        rounds = [per_round]*(episodes // per_round)
+        if episodes % per_round:
+            rounds.append(episodes % per_round)
+        return [[n//k + (rank < n % k) for n in rounds] for rank in range(k)]
+
+    def mergeDeltas(self, table, deltas, visits):
+        """ Combine the worker deltas into the shared table in place. """
+        import numpy as np
+        if self.merge == 'sum':
+            table += deltas.sum(axis=0)
+        elif self.merge == 'mean':
+            table += deltas.mean(axis=0)
+        else:
+            total = visits.sum(axis=0)
+            weighted = np.einsum('kij,kij->ij', deltas, visits)
+            np.divide(weighted, total, out=weighted, where=total > 0)
+            table += weighted
+
+    def train(self, episodes):
+        """
+        Train the agent for the given number of episodes. Raises a
+        RuntimeError if a worker fails or does not reach a merge in time;
+        the agent then keeps its Q values from before the call.
+        """
+        import multiprocessing as mp
+        from multiprocessing import shared_memory
+        import queue
+        import numpy as np
+        ctx = mp.get_context('fork' if 'fork' in mp.get_all_start_methods()
+                             else None)
+        k = self.workers
+        shape = (N_STATES, N_CELLS)
+        nbytes = N_STATES*N_CELLS*8
+        blocks = {'table': shared_memory.SharedMemory(create=True, size=nbytes),
+                  'deltas': shared_memory.SharedMemory(create=True, size=k*nbytes)}
+        if self.merge == 'visits':
+            blocks['visits'] = shared_memory.SharedMemory(create=True, size=k*nbytes)
+        procs = []
+        try:
+            table = np.ndarray(shape, dtype=np.float64, buffer=blocks['table'].buf)
+            deltas = np.ndarray((k,) + shape, dtype=np.float64,
+                                buffer=blocks['deltas'].buf)
+            visits = None
+            if self.merge == 'visits':
+                visits = np.ndarray((k,) + shape, dtype=np.int64,
+                                    buffer=blocks['visits'].buf)
+            table[:] = self.agent.Q.array
+            if self.agent.episode_log is not None:
+                # workers inherit the log; don't let them repeat its buffer
+                self.agent.episode_log.flush()
+
+            names = {key: shm.name for key, shm in blocks.items()}
+            schedule = self.schedule(episodes)
+            seeds = self.seed.spawn(k)
+            barrier = ctx.Barrier(k + 1)
+            results = ctx.Queue()
+            procs = [ctx.Process(target=_worker,
+                                 args=(rank, self.agent, self.teacher,
+                                       self.game_class, schedule[rank], names,
+                                       k, self.merge, seeds[rank],
+                                       barrier, results, self.timeout))
+                     for rank in range(k)]
+            for p in procs:
+                p.start()
+            try:
+                for _ in schedule[0]:
+                    # release the workers, then wait for their deltas
+                    _meet(barrier, procs, self.timeout)
+                    _meet(barrier, procs, self.timeout)
+                    self.mergeDeltas(table, deltas, visits)
+                # collect rewards and epsilon from the workers
+                outputs = sorted(results.get(timeout=self.timeout)
+                                 for _ in procs)
+            except (threading.BrokenBarrierError, queue.Empty):
+                barrier.abort()
+                for p in procs:
+                    p.join(1.)
+                codes = [p.exitcode for p in procs
+                         if p.exitcode not in (None, 0)]
+                if codes:
+                    raise RuntimeError("Parallel training failed: a worker "
+                                       "exited with code %i." % codes[0])
+                raise RuntimeError("Parallel training failed: the workers "
+                                   "did not reach a merge within %g seconds."
+                                   % self.timeout)
+            for p in procs:
+                p.join()
+            self.agent.Q.array[:] = table
+            for _, rewards, _ in outputs:
+                self.agent.rewards.extend(rewards)
+            self.agent.eps = min(eps for _, _, eps in outputs)
+            del table, deltas, visits
+        finally:
+            for p in procs:
+                if p.is_alive():
+                    p.terminate()
+                p.join()
+            for shm in blocks.values():
+                shm.close()
+                shm.unlink()
+        return episodes
@@ -0,0 +1,200 @@
+from tictactoe.rng import makeStream
+from tictactoe.states import legalActions
+
+
+class HumanPlayer:
+    """
+    A player that is asked for its moves at the terminal. The game result
+    is printed when the game is over.
+    """
+    def goesFirst(self):
+        """ Ask the human whether he/she would like to move first. """
+        while True:
+            response = input("Would you like to go first? [y/n]: ")
+            print('')
+            if response == 'n' or response == 'no':
+                return False
+            elif response == 'y' or response == 'yes':
+                return True
+            else:
+                print("Invalid input. Please enter 'y' or 'n'.")
+
+    def makeMove(self, board):
+        """
+        Querry the human for a move. A touple is returned that represents
+        (row, col).
+        """
+        printBoard(board)
+        while True:
+            move = input("Your move! Please select a row and column from 0-2 "
+                         "in the format row,col: ")
+            print('\n')
+            try:
+                row, col = int(move[0]), int(move[2])
+            except (ValueError, IndexError):
+                print("INVALID INPUT! Please use the correct format.")
+                continue
+            if row not in range(3) or col not in range(3) or not board[row][col] == '-':
+                print("INVALID MOVE! Choose again.")
+                continue
+            return row, col
+
+    def gameOver(self, board, key):
+        """
+        Show the final board and the result.
+
+        Parameters
+        ----------
+        board : list of lists
+            the final game board
+        key : string
+            token of the winner ('X' or 'O'), or None for a draw
+        """
+        printBoard(board)
+        if key == 'X':
+            print("Player wins!")
+        elif key == 'O':
+            print("RL agent wins!")
+        else:
+            print("It's a draw!")
+
+
+class TeacherPlayer:
+    """
+    A player that follows a teacher's strategy and never does any I/O.
+    The first mover is selected at random, with the teacher's random
+    numbers.
+
+    Parameters
+    ----------
+    teacher : Teacher
+        the teacher that selects the moves
+    """
+    def __init__(self, teacher):
+        self.teacher = teacher
+
+    def goesFirst(self):
+        """ Chose who goes first randomly with equal probability. """
+        return self.teacher.rng.random() >= 0.5
+
+    def makeMove(self, board):
+        return self.teacher.makeMove(board)
+
+    def gameOver(self, board, key):
+        pass
+
+
+class RandomPlayer:
+    """
+    A player that picks uniformly random legal moves. The first mover is
+    selected at random.
+
+    Parameters
+    ----------
+    rng : RandomStream, Generator or seed
+        source of the player's random numbers (see rng.makeStream)
+    """
+    def __init__(self, rng=None):
+        self.rng = makeStream(rng)
+
+    def goesFirst(self):
+        return self.rng.random() >= 0.5
+
+    def makeMove(self, board):
+        moves = legalActions(''.join(board[0] + board[1] + board[2]))
+        return moves[self.rng.randint(0, len(moves)-1)]
+
+    def gameOver(self, board, key):
+        pass
+
+
+# Swaps the two tokens of a state string
+_SWAP_TOKENS = str.maketrans('OX', 'XO')
+
+
+class AgentPlayer:
+    """
+    A player that follows the greedy policy of a trained agent. Agents learn
+    to play 'O', so the board is seen with the tokens swapped. Ties between
+    the best moves are broken at random, and the agent is never updated.
+    The first mover is selected at random.
+
+    Parameters
+    ----------
+    agent : Learner
+        the trained agent
+    rng : RandomStream, Generator or seed
+        source of the player's random numbers (see rng.makeStream)
+    """
+    def __init__(self, agent, rng=None):
+        self.agent = agent
+        self.rng = makeStream(rng)
+
+    def goesFirst(self):
+        return self.rng.random() >= 0.5
+
+    def makeMove(self, board):
+        s = ''.join(board[0] + board[1] + board[2]).translate(_SWAP_TOKENS)
+        moves = legalActions(s)
+        values = list(self.agent.Q.values(s, moves))
+        best = max(values)
+        return self.rng.choice([a for a, v in zip(moves, values) if v == best])
+
+    def gameOver(self, board, key):
+        pass
+
+
+class LearnerPlayer:
+    """
+    A player whose moves are chosen by a learner that keeps learning from
+    them, for self-play. As for AgentPlayer, the board is seen with the
+    tokens swapped. Each move completes the learner's previous transition
+    with a reward of 0, and the end of the game completes the last one with
+    +1 for an 'X' win, -1 for a loss and 0 for a draw. The first mover is
+    selected at random, with the learner's random numbers.
+
+    Parameters
+    ----------
+    agent : Learner
+        the learner playing 'X'. It may share its Q-table with the agent
+        playing 'O'
+    """
+    def __init__(self, agent):
+        self.agent = agent
+        self.prev_state = None
+        self.prev_action = None
+
+    def goesFirst(self):
+        return self.agent.rng.random() >= 0.5
+
+    def makeMove(self, board):
+        s = ''.join(board[0] + board[1] + board[2]).translate(_SWAP_TOKENS)
+        action = self.agent.get_action(s)
+        if self.prev_state is not None:
+            self.agent.update(self.prev_state, s, self.prev_action, action, 0)
+        self.prev_state = s
+        self.prev_action = action
+        return action
+
+    def gameOver(self, board, key):
+        reward = 1 if key == 'X' else -1 if key == 'O' else 0
+        self.agent.update(self.prev_state, None, self.prev_action, None, reward)
+        self.prev_state = None
+        self.prev_action = None
+
+
+def printBoard(board):
+    """
+    Prints the game board as text output to the terminal.
+
+    Parameters
+    ----------
+    board : list of lists
+        the current game board
+    """
+    print('    0   1   2\n')
+    for i, row in enumerate(board):
+        print('%i   ' % i, end='')
+        for elt in row:
+            print('%s   ' % elt, end='')
+        print('\n')
@@ -0,0 +1,78 @@
+from array import array
+import random
+import sys
+
+from tictactoe.files import atomicOpen
+from tictactoe.qtable import N_CELLS, N_STATES, encodeState
+from tictactoe.states import MASK_ACTIONS
+
+
+# Leading bytes of a compiled policy file. The header is followed by one
+# little-endian 16-bit mask per encoded board (see compilePolicy).
+MAGIC = b'TTTPOL01'
+
+
+def compilePolicy(agent, path):
+    """
+    Write the greedy policy of an agent to a compiled policy file. For every
+    encoded board (see qtable.encodeState), the file holds a bitmask of the
+    legal cells with the highest Q value; bit k stands for cell k = row*3 +
+    col. The file is about 39 KB and loads with one read, without NumPy or
+    the agent's classes (see CompiledPolicy).
+
+    Parameters
+    ----------
+    agent : Learner
+        the trained agent, with any Q-table backend
+    path : string
+        output file path. The file is replaced atomically
+    """
+    import numpy as np
+    from tictactoe.inference import denseValues, legalMask
+    legal = legalMask(np.arange(N_STATES))
+    values = np.where(legal, denseValues(agent.Q), -np.inf)
+    # the same ties as Learner.get_action: every move equal to the max
+    best = (values == values.max(axis=1, keepdims=True)) & legal
+    masks = (best << np.arange(N_CELLS)).sum(axis=1).astype('<u2')
+    with atomicOpen(path) as f:
+        f.write(MAGIC)
+        f.write(masks.tobytes())
+
+
+class CompiledPolicy:
+    """
+    A frozen greedy agent that looks its moves up in a compiled policy (see
+    compilePolicy). It has the get_action and update methods of a learner,
+    so it can play 'O' in a Game; updates are ignored. Ties between the best
+    moves are broken at random. The random numbers come from a Python
+    random.Random, so that playing never imports NumPy.
+
+    Parameters
+    ----------
+    masks : array of unsigned 16-bit ints
+        the best-move mask of each encoded board
+    seed : int
+        seed for the tie-breaking random numbers
+    """
+    def __init__(self, masks, seed=None):
+        self.masks = masks
+        self.rng = random.Random(seed)
+
+    @classmethod
+    def load(cls, path, seed=None):
+        """ Load a compiled policy file. """
+        with open(path, 'rb') as f:
+            data = f.read()
+        if not data.startswith(MAGIC) or len(data) != len(MAGIC) + 2*N_STATES:
+            raise ValueError("%s is not a compiled policy file." % path)
+        masks = array('H', data[len(MAGIC):])
+        if sys.byteorder == 'big':
+            masks.byteswap()
+        return cls(masks, seed)
+
+    def get_action(self, s):
+        moves = MASK_ACTIONS[self.masks[encodeState(s)]]
+        return moves[0] if len(moves) == 1 else self.rng.choice(moves)
+
+    def update(self, s, s_, a, a_, r):
+        pass
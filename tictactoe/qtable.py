@@ -0,0 +1,379 @@
+from abc import ABC, abstractmethod
+from array import array
+import collections
+import heapq
+import sys
+
+
+# Number of board cells and the number of distinct boards under a
+# base-3 encoding of the cells ('-' = 0, 'O' = 1, 'X' = 2).
+N_CELLS = 9
+N_STATES = 3**N_CELLS
+
+_ENCODE_TABLE = str.maketrans('-OX', '012')
+
+# Ways in which a LazyQTable picks the states to evict
+EVICTION_POLICIES = ('lru', 'visits')
+
+
+def encodeState(s):
+    """
+    Converts a 9-character state key (see game.getStateKey) into a compact
+    integer index in the range [0, 3^9). The first character of the key is
+    the most significant base-3 digit.
+
+    Parameters
+    ----------
+    s : string
+        state
+    """
+    return int(s.translate(_ENCODE_TABLE), 3)
+
+
+# Codes of the states encoded so far (at most 3^9 of them), so that the
+# dense tables convert each state string only once
+_CODES = {}
+
+
+def _stateCode(s):
+    code = _CODES.get(s)
+    if code is None:
+        code = _CODES[s] = int(s.translate(_ENCODE_TABLE), 3)
+    return code
+
+
+def decodeState(code):
+    """
+    Inverse of encodeState. Returns the 9-character state key for an
+    integer index.
+
+    Parameters
+    ----------
+    code : int
+        encoded state
+    """
+    chars = []
+    for _ in range(N_CELLS):
+        code, digit = divmod(code, 3)
+        chars.append('-OX'[digit])
+    return ''.join(reversed(chars))
+
+
+def actionIndex(a):
+    """ Converts an (i,j) action tuple into a flat cell index 0-8. """
+    return a[0]*3 + a[1]
+
+
+class QTable(ABC):
+    """
+    Interface for the storage of an agent's Q values. States are the string
+    keys produced by game.getStateKey and actions are (i,j) tuples.
+    """
+    @abstractmethod
+    def get(self, s, a):
+        """ Return Q(s,a). """
+        pass
+
+    @abstractmethod
+    def values(self, s, actions):
+        """ Return a list holding Q(s,a) for each action a in 'actions'. """
+        pass
+
+    @abstractmethod
+    def add(self, s, a, delta):
+        """ Increment Q(s,a) by 'delta'. """
+        pass
+
+    @abstractmethod
+    def size(self):
+        """ Return the number of state-action values held by the table. """
+        pass
+
+
+class DictQTable(QTable):
+    """
+    The original Q-table layout: one defaultdict per action, keyed by state
+    string. Access value for action a, state s via Q[a][s].
+    """
+    def __init__(self, actions):
+        self.Q = {}
+        for action in actions:
+            self.Q[action] = collections.defaultdict(int)
+
+    def __getitem__(self, a):
+        return self.Q[a]
+
+    def get(self, s, a):
+        return self.Q[a][s]
+
+    def values(self, s, actions):
+        return [self.Q[a][s] for a in actions]
+
+    def add(self, s, a, delta):
+        self.Q[a][s] += delta
+
+    def size(self):
+        return sum(len(d) for d in self.Q.values())
+
+
+class DenseQTable(QTable):
+    """
+    Q values held in a single contiguous array of shape (3^9, 9). Row index
+    is the encoded state (see encodeState) and column index is the flat
+    cell index of the action. Single values are read and written through a
+    flat memoryview of the array, which yields Python floats directly.
+
+    Parameters
+    ----------
+    dtype : numpy dtype
+        floating point type of the Q values. Defaults to float64
+    array : (3^9, 9) array
+        existing Q values to use (e.g. a memory-mapped checkpoint) instead of
+        a new array of zeros
+    """
+    def __init__(self, dtype=None, array=None):
+        if array is None:
+            # only the array-backed tables need NumPy; import it on use
+            import numpy as np
+            array = np.zeros((N_STATES, N_CELLS), dtype=dtype or np.float64)
+        self.array = array
+        self.flat = memoryview(array.reshape(-1))
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        # memoryviews cannot be pickled; the view is rebuilt on load
+        del state['flat']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.flat = memoryview(self.array.reshape(-1))
+
+    @classmethod
+    def fromTable(cls, table, dtype=None):
+        """ Build a dense table holding the same values as 'table'. """
+        dense = cls(dtype)
+        if isinstance(table, DenseQTable):
+            dense.array[:] = table.array
+            return dense
+        if isinstance(table, SparseQTable):
+            cells = [actionIndex(a) for a in table.columns]
+            for s, row in table.rows.items():
+                dense.array[encodeState(s), cells] = row
+            return dense
+        for a, d in table.Q.items():
+            for s, v in d.items():
+                dense.array[encodeState(s), actionIndex(a)] = v
+        return dense
+
+    def get(self, s, a):
+        return self.flat[_stateCode(s)*N_CELLS + a[0]*3 + a[1]]
+
+    def values(self, s, actions):
+        flat = self.flat
+        base = _stateCode(s)*N_CELLS
+        return [flat[base + a[0]*3 + a[1]] for a in actions]
+
+    def add(self, s, a, delta):
+        self.flat[_stateCode(s)*N_CELLS + a[0]*3 + a[1]] += delta
+
+    def size(self):
+        # the array has a slot for every pair; count those that were set
+        import numpy as np
+        return int(np.count_nonzero(self.array))
+
+
+class TrackedQTable(DenseQTable):
+    """
+    A dense Q-table that records which entries changed, so that only those
+    need to be written by an incremental checkpoint.
+
+    Parameters
+    ----------
+    array : (3^9, 9) array
+        the Q values, shared with the table being tracked
+    """
+    def __init__(self, array):
+        super().__init__(array=array)
+        # flat indices (state*9 + action) changed since the last takeDirty()
+        self.dirty = set()
+
+    def add(self, s, a, delta):
+        i = _stateCode(s)*N_CELLS + a[0]*3 + a[1]
+        self.flat[i] += delta
+        self.dirty.add(i)
+
+    def takeDirty(self):
+        """ Return the sorted changed flat indices and clear the record. """
+        import numpy as np
+        dirty = np.fromiter(self.dirty, dtype=np.int64, count=len(self.dirty))
+        self.dirty = set()
+        dirty.sort()
+        return dirty
+
+
+class SparseQTable(QTable):
+    """
+    Q values held only for the states that have been updated: a dict maps
+    each state to a compact row of doubles, one per action. Unseen states
+    read as 0. Memory grows with the number of states visited rather than
+    with the size of the state space, so the table also works for boards
+    whose states do not fit a dense array. States can be any hashable key,
+    e.g. the Zobrist hash of an m,n,k board (see mnk.py).
+
+    Parameters
+    ----------
+    actions : list of (i,j) tuples
+        the set of all actions
+    """
+    def __init__(self, actions):
+        # column of each action within a row
+        self.columns = {a: k for k, a in enumerate(actions)}
+        self.rows = {}
+        self._zeros = array('d', bytes(8*len(actions)))
+
+    def get(self, s, a):
+        row = self.rows.get(s)
+        return 0. if row is None else row[self.columns[a]]
+
+    def values(self, s, actions):
+        row = self.rows.get(s)
+        if row is None:
+            return [0.]*len(actions)
+        columns = self.columns
+        return [row[columns[a]] for a in actions]
+
+    def add(self, s, a, delta):
+        row = self.rows.get(s)
+        if row is None:
+            row = self.rows[s] = self._zeros[:]
+        row[self.columns[a]] += delta
+
+    def size(self):
+        # rows are allocated whole; count the values that were set
+        return sum(len(row) - row.count(0.) for row in self.rows.values())
+
+
+class LazyQTable(SparseQTable):
+    """
+    A sparse table that can be capped at a number of resident states, and
+    that keeps statistics on its use. As in SparseQTable, a row is created
+    on the first write to a state, and reading a state without a row
+    returns zeros without allocating anything. When a new row would exceed
+    'max_states', rarely used states are evicted; their values are lost and
+    read as 0 again. Reads and writes both count as a use of a state.
+
+    Parameters
+    ----------
+    actions : list of (i,j) tuples
+        the set of all actions
+    max_states : int
+        maximum number of resident states. None for no limit
+    eviction : string
+        'lru' evicts the least recently used state; 'visits' evicts the
+        least used states, 1/16 of the table at a time so that the search
+        for them is amortized
+    """
+    def __init__(self, actions, max_states=None, eviction='lru'):
+        if eviction not in EVICTION_POLICIES:
+            raise ValueError("Unknown eviction policy '%s'." % eviction)
+        super().__init__(actions)
+        # rows are kept in order of last use for 'lru'
+        self.rows = collections.OrderedDict()
+        self.max_states = max_states
+        self.eviction = eviction
+        # number of uses of each resident state, for 'visits'
+        self.visits = {}
+        self.reads = 0
+        self.hits = 0
+        self.evictions = 0
+
+    def _use(self, s):
+        """ Return the row of s (or None), counting a use of the state. """
+        row = self.rows.get(s)
+        if row is not None:
+            if self.eviction == 'lru':
+                self.rows.move_to_end(s)
+            else:
+                self.visits[s] += 1
+        return row
+
+    def get(self, s, a):
+        self.reads += 1
+        row = self._use(s)
+        if row is None:
+            return 0.
+        self.hits += 1
+        return row[self.columns[a]]
+
+    def values(self, s, actions):
+        self.reads += 1
+        row = self._use(s)
+        if row is None:
+            return [0.]*len(actions)
+        self.hits += 1
+        columns = self.columns
+        return [row[columns[a]] for a in actions]
+
+    def add(self, s, a, delta):
+        row = self._use(s)
+        if row is None:
+            if self.max_states is not None and len(self.rows) >= self.max_states:
+                self.evict()
+            row = self.rows[s] = self._zeros[:]
+            if self.eviction == 'visits':
+                self.visits[s] = 1
+        row[self.columns[a]] += delta
+
+    def evict(self):
+        """ Evict rarely used states to make room for a new row. """
+        if self.eviction == 'lru':
+            self.rows.popitem(last=False)
+            self.evictions += 1
+            return
+        # ties go to the states that became resident first
+        n = max(1, len(self.rows)//16)
+        for s in heapq.nsmallest(n, self.visits, key=self.visits.get):
+            del self.rows[s]
+            del self.visits[s]
+        self.evictions += n
+
+    def stats(self):
+        """
+        Return a dict with the number of resident states, the bytes held by
+        their rows, the number of reads, the fraction of reads that found a
+        row, and the number of states evicted.
+        """
+        return {'states': len(self.rows),
+                'bytes': len(self.rows)*sys.getsizeof(self._zeros),
+                'reads': self.reads,
+                'hit_rate': self.hits/self.reads if self.reads else 0.,
+                'evictions': self.evictions}
+
+
+def makeQTable(backend, actions, max_states=None, eviction='lru'):
+    """
+    Create an empty Q-table.
+
+    Parameters
+    ----------
+    backend : string
+        'dict' for the dict-of-defaultdicts table, 'dense' for the
+        array-backed table, 'sparse' for rows allocated per visited state
+        and 'lazy' for sparse rows with an optional cap and statistics
+    actions : list of (i,j) tuples
+        the set of all actions
+    max_states : int
+        for the 'lazy' backend, the maximum number of resident states
+    eviction : string
+        for the 'lazy' backend, the eviction policy (see LazyQTable)
+    """
+    if backend == 'dict':
+        return DictQTable(actions)
+    elif backend == 'dense':
+        return DenseQTable()
+    elif backend == 'sparse':
+        return SparseQTable(actions)
+    elif backend == 'lazy':
+        return LazyQTable(actions, max_states, eviction)
+    raise ValueError("Unknown Q-table backend '%s'." % backend)
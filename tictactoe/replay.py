@@ -0,0 +1,94 @@
+import numpy as np
+
+from tictactoe.qtable import N_CELLS
+
+
+# Place values of the base-3 digits of an encoded state (see
+# qtable.encodeState), most significant first
+_POWERS = 3**np.arange(N_CELLS - 1, -1, -1)
+
+
+def legalFromCodes(codes):
+    """ Boolean (N,9) mask of the empty cells of each encoded state. """
+    return (codes[:, None] // _POWERS) % 3 == 0
+
+
+class ReplayBuffer:
+    """
+    A fixed-capacity ring buffer of transitions (s, a, r, s', done), held in
+    preallocated NumPy arrays. States are encoded with qtable.encodeState
+    and actions are flat cell indices. Once full, the oldest transitions are
+    overwritten.
+
+    With prioritized sampling, transitions are drawn with probability
+    proportional to priority^exponent, where the priority is the magnitude
+    of the last TD error seen for the transition (new transitions get the
+    highest priority so far). Samples then come with importance-sampling
+    weights that correct for the non-uniform draw.
+
+    Parameters
+    ----------
+    capacity : int
+        maximum number of transitions held
+    prioritized : bool
+        whether to sample by priority instead of uniformly
+    exponent : float
+        how strongly priorities skew the sampling (0 = uniform)
+    beta : float
+        importance-sampling correction (1 = full correction)
+    seed : int, SeedSequence or Generator
+        seed for the sampling random number generator, or the Generator
+    """
+    def __init__(self, capacity, prioritized=False, exponent=0.6, beta=0.4,
+                 seed=None):
+        self.capacity = capacity
+        self.states = np.zeros(capacity, dtype=np.int64)
+        self.actions = np.zeros(capacity, dtype=np.int64)
+        self.rewards = np.zeros(capacity, dtype=np.float64)
+        self.next_states = np.zeros(capacity, dtype=np.int64)
+        self.done = np.zeros(capacity, dtype=bool)
+        self.prioritized = prioritized
+        self.exponent = exponent
+        self.beta = beta
+        self.priorities = np.zeros(capacity, dtype=np.float64)
+        self.max_priority = 1.
+        self.rng = np.random.default_rng(seed)
+        # total number of transitions ever added
+        self.count = 0
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    def add(self, s, a, r, s_, done):
+        """
+        Add one transition. For a terminal transition (done), s_ is
+        ignored.
+        """
+        i = self.count % self.capacity
+        self.states[i] = s
+        self.actions[i] = a
+        self.rewards[i] = r
+        self.next_states[i] = 0 if done else s_
+        self.done[i] = done
+        self.priorities[i] = self.max_priority
+        self.count += 1
+
+    def sample(self, n):
+        """
+        Draw n transitions (with replacement). Returns their buffer indices
+        and their importance-sampling weights (all 1 for uniform sampling).
+        """
+        size = len(self)
+        if not self.prioritized:
+            return self.rng.integers(size, size=n), np.ones(n)
+        p = self.priorities[:size]**self.exponent
+        p /= p.sum()
+        idx = self.rng.choice(size, size=n, p=p)
+        weights = (size*p[idx])**-self.beta
+        return idx, weights/weights.max()
+
+    def updatePriorities(self, idx, errors):
+        """ Set the priorities of sampled transitions from their TD errors. """
+        priorities = np.abs(errors) + 1e-6
+        self.priorities[idx] = priorities
+        self.max_priority = max(self.max_priority, priorities.max())
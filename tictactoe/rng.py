@@ -0,0 +1,60 @@
+class RandomStream:
+    """
+    A per-instance source of random numbers backed by a NumPy Generator.
+    The game loop draws single numbers, which are slow to get from a
+    Generator one call at a time, so uniform floats are drawn in blocks and
+    handed out one by one. A stream created from a given seed always yields
+    the same sequence.
+
+    Parameters
+    ----------
+    seed : None, int, SeedSequence or Generator
+        seed of the stream, or the Generator to draw from
+    block_size : int
+        number of values drawn from the Generator at once
+    """
+    def __init__(self, seed=None, block_size=1024):
+        # NumPy is only imported once a stream is needed, so that the game
+        # modules stay cheap to import
+        import numpy as np
+        self.generator = np.random.default_rng(seed)
+        self.block_size = block_size
+        self.block = []
+
+    def random(self):
+        """ Return a float in [0, 1). """
+        if not self.block:
+            self.block = self.generator.random(self.block_size).tolist()
+        return self.block.pop()
+
+    def randint(self, a, b):
+        """ Return an int in [a, b], both included (as random.randint). """
+        return a + int(self.random()*(b - a + 1))
+
+    def choice(self, seq):
+        """ Return a uniformly random element of a non-empty sequence. """
+        return seq[int(self.random()*len(seq))]
+
+    def spawn(self, n):
+        """ Return n independent child streams. """
+        return [RandomStream(g, self.block_size)
+                for g in self.generator.spawn(n)]
+
+
+def makeStream(rng=None):
+    """
+    Return a RandomStream for 'rng', which is either a stream (returned as
+    is) or anything RandomStream accepts as a seed.
+    """
+    if isinstance(rng, RandomStream):
+        return rng
+    return RandomStream(rng)
+
+
+def spawnSeeds(seed, n):
+    """
+    Derive n independent seeds (SeedSequences) from one seed, e.g. one for
+    each worker process.
+    """
+    import numpy as np
+    return np.random.SeedSequence(seed).spawn(n)
@@ -0,0 +1,141 @@
+import numpy as np
+
+from tictactoe.agent import TraceLearner
+from tictactoe.batch import (AGENT, EMPTY, TEACHER, BatchTrainer, encodeBoards,
+                             hasWon, isFull)
+from tictactoe.qtable import DenseQTable, LazyQTable, N_CELLS, SparseQTable
+from tictactoe.symmetry import SymmetricQTable
+
+
+# Maps the cells of a batched board onto the board seen by the 'X' player,
+# who plays as the agent with the tokens swapped
+_SWAP_CELLS = np.array([EMPTY, TEACHER, AGENT], dtype=np.int8)
+
+
+def mirrorLearner(agent, shared=True, rng=None):
+    """
+    Create the 'X' learner for self-play against 'agent': a learner of the
+    same class, with the same hyperparameters, actions and Q-table backend.
+    The mirror keeps its own eligibility traces, if the class has them.
+    Learners always see themselves as 'O' (see players.LearnerPlayer), so
+    with 'shared' both players train the agent's own Q-table; otherwise the
+    mirror starts from an empty table of its own.
+
+    Parameters
+    ----------
+    agent : Learner
+        the agent playing 'O'
+    shared : bool
+        whether both players use the agent's Q-table
+    rng : RandomStream, Generator or seed
+        source of the mirror's random numbers (see rng.makeStream)
+    """
+    symmetric = isinstance(agent.Q, SymmetricQTable)
+    table = agent.Q.table if symmetric else agent.Q
+    options = {}
+    if isinstance(table, DenseQTable):
+        backend = 'dense'
+    elif isinstance(table, LazyQTable):
+        backend = 'lazy'
+        options = dict(max_states=table.max_states, eviction=table.eviction)
+    elif isinstance(table, SparseQTable):
+        backend = 'sparse'
+    else:
+        backend = 'dict'
+    if isinstance(agent, TraceLearner):
+        options.update(lam=agent.lam, trace=agent.trace, cutoff=agent.cutoff)
+    opponent = type(agent)(agent.alpha, agent.gamma, agent.eps,
+                           agent.eps_decay, backend=backend,
+                           symmetric=symmetric, rng=rng, actions=agent.actions,
+                           **options)
+    if shared:
+        opponent.Q = agent.Q
+    return opponent
+
+
+class SelfPlayTrainer:
+    """
+    Trains two learners against each other by advancing many independent
+    games in lockstep as NumPy arrays, as BatchTrainer does against a
+    teacher. In every step, each game's player to move picks an action and
+    completes its previous transition, so both learners update in the same
+    loop. When a game ends, the winner's last transition gets +1 and the
+    loser's -1 (0 each for a draw). Both learners must use the dense Q-table
+    backend, and they may share one table.
+
+    Parameters
+    ----------
+    agent : Learner
+        the learner playing 'O'
+    opponent : Learner
+        the learner playing 'X' (see mirrorLearner). It sees the boards
+        with the tokens swapped
+    batch_size : int
+        number of games played in lockstep
+    seed : int, SeedSequence or Generator
+        seed for the random number generator
+    """
+    def __init__(self, agent, opponent, batch_size=1024, seed=None):
+        self.rng = np.random.default_rng(seed)
+        # one trainer per side, indexed by the side's cell value; both draw
+        # from the same generator
+        self.sides = {AGENT: BatchTrainer(agent, None, batch_size, self.rng),
+                      TEACHER: BatchTrainer(opponent, None, batch_size, self.rng)}
+        self.batch_size = batch_size
+
+    def finish(self, side, games, s, a, won, boards):
+        """ Make the terminal updates of both sides for the ended games. """
+        r = won.astype(np.int64)
+        for token, reward in ((side, r), (AGENT + TEACHER - side, -r)):
+            learner = self.sides[token]
+            learner.update(s[token, games], a[token, games], reward)
+            if learner.agent.episode_log is not None:
+                learner.agent.episode_log.recordMany(
+                    reward, (boards[games] == token).sum(axis=1))
+
+    def playBatch(self, n):
+        """ Play n games in lockstep, updating both learners as they go. """
+        rng = self.rng
+        boards = np.zeros((n, N_CELLS), dtype=np.int8)
+        # chose who goes first randomly with equal probability
+        mover = np.where(rng.random(n) >= 0.5, TEACHER, AGENT)
+        # the pending transition of each side in each game, indexed by the
+        # side's cell value; -1 until the side has moved
+        s = np.full((3, n), -1, dtype=np.int64)
+        a = np.zeros((3, n), dtype=np.int64)
+        over = np.zeros(n, dtype=bool)
+        games = np.arange(n)
+        # iterate until every game is over
+        while len(games):
+            for side, learner in self.sides.items():
+                rows = games[mover[games] == side]
+                if not len(rows):
+                    continue
+                view = boards[rows] if side == AGENT else _SWAP_CELLS[boards[rows]]
+                s_ = encodeBoards(view)
+                a_ = learner.getActions(view)
+                # continuing games: the new action completes the previous one
+                moved = s[side, rows] >= 0
+                if moved.any():
+                    learner.update(s[side, rows[moved]], a[side, rows[moved]],
+                                   np.zeros(moved.sum(), dtype=np.int64),
+                                   s_[moved], view[moved], a_[moved])
+                s[side, rows] = s_
+                a[side, rows] = a_
+                boards[rows, a_] = side
+                won = hasWon(boards[rows], side)
+                ended = won | isFull(boards[rows])
+                if ended.any():
+                    self.finish(side, rows[ended], s, a, won[ended], boards)
+                    over[rows[ended]] = True
+            games = games[~over[games]]
+            mover[games] = AGENT + TEACHER - mover[games]
+
+    def train(self, episodes):
+        """ Train both learners for the given number of episodes. """
+        played = 0
+        while played < episodes:
+            n = min(self.batch_size, episodes - played)
+            self.playBatch(n)
+            played += n
+        return played
@@ -0,0 +1,246 @@
+import asyncio
+import copy
+
+from tictactoe.bitboard import BitBoard
+from tictactoe.checkpoint import saveAgent
+from tictactoe.inference import Policy
+from tictactoe.qtable import encodeState
+
+
+# Line protocol. Each request and response is one line of ASCII text.
+#
+#   client -> server
+#     NEW [first|second]   start a game; the human moves first or second
+#                          (default first)
+#     MOVE <row> <col>     place an 'X'
+#     QUIT                 close the connection
+#
+#   server -> client
+#     BOARD <key>          the board after the human's move (9 chars of -XO)
+#     AGENT <row> <col>    the agent's move
+#     END <X|O|DRAW>       the game is over; X is the human, O the agent
+#     ERR <message>        the request was rejected
+HELP = "commands: NEW [first|second], MOVE <row> <col>, QUIT"
+
+
+class MoveBatcher:
+    """
+    Collects the agent move requests of all sessions and answers them
+    with one vectorized Policy call per event loop iteration.
+    """
+    def __init__(self, policy):
+        self.policy = policy
+        self.pending = []
+
+    def request(self, key):
+        """ Return a future that resolves to the agent's (row, col) move. """
+        future = asyncio.get_running_loop().create_future()
+        if not self.pending:
+            asyncio.get_running_loop().call_soon(self.flush)
+        self.pending.append((encodeState(key), future))
+        return future
+
+    def flush(self):
+        pending, self.pending = self.pending, []
+        cells = self.policy.act([code for code, _ in pending])
+        for (_, future), cell in zip(pending, cells.tolist()):
+            if not future.cancelled():
+                future.set_result(divmod(cell, 3))
+
+
+class Session:
+    """
+    One human-vs-agent game. Transitions follow Game.playGame: when the
+    server is learning, each agent transition is handed to 'learn' as the
+    arguments of a Learner.update call.
+    """
+    def __init__(self, learn=None):
+        self.bits = BitBoard()
+        self.learn = learn
+        self.prev_state = None
+        self.prev_action = None
+
+    def moveAgent(self, action):
+        """ Place the agent's move. Returns the winner, 'DRAW' or None. """
+        self.prev_state, self.prev_action = self.bits.key, action
+        self.bits.place(action, 'O')
+        if self.bits.hasWon('O'):
+            return self.finish(1, 'O')
+        elif self.bits.isFull():
+            return self.finish(0, 'DRAW')
+        return None
+
+    def moveHuman(self, action):
+        """ Place the human's move. Returns the winner, 'DRAW' or None. """
+        self.bits.place(action, 'X')
+        if self.bits.hasWon('X'):
+            return self.finish(-1, 'X')
+        elif self.bits.isFull():
+            return self.finish(0, 'DRAW')
+        return None
+
+    def continueWith(self, action):
+        """ Record the transition into the agent's next move. """
+        if self.learn is not None and self.prev_state is not None:
+            self.learn(self.prev_state, self.bits.key, self.prev_action,
+                       action, 0)
+
+    def finish(self, reward, result):
+        if self.learn is not None and self.prev_state is not None:
+            self.learn(self.prev_state, None, self.prev_action, None, reward)
+        return result
+
+
+class GameServer:
+    """
+    An asyncio server that hosts many concurrent human-vs-agent games over
+    one loaded agent, one game at a time per connection.
+
+    Without learning, agent moves are greedy and come from a read-only
+    Policy, batched across all sessions. With learning, moves come from the
+    agent's epsilon-greedy get_action and the Q updates are queued and
+    applied by a background task, a chunk at a time. A second background
+    task saves the agent every 'checkpoint_interval' seconds if it has
+    learned anything, writing a snapshot of it in a worker thread.
+
+    Parameters
+    ----------
+    agent : Learner
+        the agent playing 'O'
+    learn : bool
+        whether the agent keeps learning from the games
+    path : string
+        where checkpoints are saved (see checkpoint.saveAgent)
+    checkpoint_interval : float
+        seconds between checkpoints
+    seed : int
+        seed for the policy's random tie-breaking
+    """
+    def __init__(self, agent, learn=False, path=None, checkpoint_interval=60.,
+                 seed=None):
+        self.agent = agent
+        self.learning = learn
+        self.path = path
+        self.checkpoint_interval = checkpoint_interval
+        self.batcher = None if learn else MoveBatcher(Policy(agent, seed=seed))
+        self.updates = asyncio.Queue() if learn else None
+        self.dirty = False
+        self.sessions = 0
+
+    async def agentMove(self, key):
+        if self.batcher is not None:
+            return await self.batcher.request(key)
+        return self.agent.get_action(key)
+
+    def queueUpdate(self, s, s_, a, a_, r):
+        self.updates.put_nowait((s, s_, a, a_, r))
+
+    async def applyUpdates(self, chunk=256):
+        """ Background task: apply queued Q updates, yielding between chunks. """
+        while True:
+            args = await self.updates.get()
+            self.agent.update(*args)
+            for _ in range(min(chunk, self.updates.qsize())):
+                self.agent.update(*self.updates.get_nowait())
+            self.dirty = True
+
+    async def checkpoint(self):
+        """ Background task: periodically save a snapshot of the agent. """
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(self.checkpoint_interval)
+            await self.save(loop)
+
+    async def save(self, loop):
+        if not self.dirty or self.path is None:
+            return
+        self.dirty = False
+        snapshot = copy.deepcopy(self.agent)
+        snapshot.episode_log = None
+        await loop.run_in_executor(None, saveAgent, snapshot, self.path)
+
+    async def send(self, writer, line):
+        writer.write((line + '\n').encode('ascii'))
+        await writer.drain()
+
+    async def playAgent(self, session, writer):
+        """ Make the agent's move. Returns True if the game is over. """
+        action = await self.agentMove(session.bits.key)
+        session.continueWith(action)
+        result = session.moveAgent(action)
+        await self.send(writer, 'AGENT %i %i' % action)
+        if result is not None:
+            await self.send(writer, 'END %s' % result)
+            return True
+        return False
+
+    async def handle(self, reader, writer):
+        """ Serve one connection. """
+        self.sessions += 1
+        learn = self.queueUpdate if self.learning else None
+        session = None
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                words = line.decode('ascii', 'replace').split()
+                if not words:
+                    continue
+                command = words[0].upper()
+                if command == 'QUIT':
+                    break
+                elif command == 'NEW':
+                    session = Session(learn)
+                    if len(words) > 1 and words[1].lower() == 'second':
+                        await self.playAgent(session, writer)
+                    else:
+                        await self.send(writer, 'BOARD %s' % session.bits.key)
+                elif command == 'MOVE':
+                    try:
+                        row, col = int(words[1]), int(words[2])
+                    except (IndexError, ValueError):
+                        await self.send(writer, 'ERR usage: MOVE <row> <col>')
+                        continue
+                    if session is None:
+                        await self.send(writer, 'ERR no game; send NEW')
+                    elif (row, col) not in session.bits.legalMoves():
+                        await self.send(writer, 'ERR invalid move')
+                    else:
+                        result = session.moveHuman((row, col))
+                        await self.send(writer, 'BOARD %s' % session.bits.key)
+                        if result is not None:
+                            await self.send(writer, 'END %s' % result)
+                            session = None
+                        elif await self.playAgent(session, writer):
+                            session = None
+                else:
+                    await self.send(writer, 'ERR %s' % HELP)
+        except ConnectionError:
+            pass
+        finally:
+            self.sessions -= 1
+            writer.close()
+
+    async def serve(self, host='127.0.0.1', port=8765, unix_path=None):
+        """ Serve forever on a TCP port, or on a Unix socket if given. """
+        tasks = []
+        if self.learning:
+            tasks.append(asyncio.create_task(self.applyUpdates()))
+            tasks.append(asyncio.create_task(self.checkpoint()))
+        if unix_path is not None:
+            server = await asyncio.start_unix_server(self.handle, unix_path)
+        else:
+            server = await asyncio.start_server(self.handle, host, port)
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            for task in tasks:
+                task.cancel()
+            if self.learning:
+                # apply what is left and write a final checkpoint
+                while not self.updates.empty():
+                    self.agent.update(*self.updates.get_nowait())
+                    self.dirty = True
+                await self.save(asyncio.get_running_loop())
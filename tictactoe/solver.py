@@ -0,0 +1,262 @@
+import numpy as np
+
+from tictactoe.agent import Qlearner
+from tictactoe.inference import denseValues
+from tictactoe.qtable import DenseQTable, N_CELLS, encodeState
+from tictactoe.states import gameResult, legalActions
+
+
+def _place(key, cell, token):
+    return key[:cell] + token + key[cell+1:]
+
+
+def teacherDistribution(teacher, key):
+    """
+    Return the teacher's move distribution on state string 'key' as a dict
+    cell -> probability. A Teacher plays its optimal move with probability
+    'ability_level' and a uniformly random legal move otherwise. A
+    PerfectTeacher with random_ties spreads the optimal share uniformly
+    over all optimal moves.
+    """
+    board = [list(key[0:3]), list(key[3:6]), list(key[6:9])]
+    cells = [i*3 + j for i, j in legalActions(key)]
+    level = teacher.ability_level
+    dist = dict.fromkeys(cells, (1. - level)/len(cells))
+    if getattr(teacher, 'random_ties', False):
+        best = [i*3 + j for i, j in teacher.optimalMoves(board)]
+    else:
+        i, j = teacher.optimalMove(board)
+        best = [i*3 + j]
+    for cell in best:
+        # the heuristic teacher can pick an occupied cell; the game then
+        # overwrites it, and so does the model
+        dist[cell] = dist.get(cell, 0.) + level/len(best)
+    return dist
+
+
+class Solution:
+    """
+    The exact Q values of the agent against a fixed teacher, found by value
+    iteration over every state in which the agent can be asked to move.
+    Games start with either player moving first with equal probability, as
+    in Game.start. Rewards and discounting match the learners' updates:
+    +1 for a win, -1 for a loss, 0 otherwise, and 'gamma' per agent move.
+
+    The model is built once in Python. Each backup is then one vectorized
+    pass over all state-action pairs, and since the game is finite the
+    iteration converges exactly in at most a few sweeps.
+
+    Parameters
+    ----------
+    teacher : Teacher
+        the opponent, playing 'X'
+    gamma : float
+        temporal discounting rate
+    eps : float
+        exploration rate of the agent's policy. 0 gives the optimal Q*
+        (the fixed point of Q-learning); a positive value gives the values
+        of the epsilon-greedy policy (the fixed point of SARSA)
+    """
+    def __init__(self, teacher, gamma=0.9, eps=0.):
+        self.gamma = gamma
+        self.eps = eps
+        self._buildModel(teacher)
+        self.Q = self.iterate(self.reward, self.greedyValues)
+
+    def _buildModel(self, teacher):
+        self.keys = []
+        ids = {}
+
+        def agentState(key):
+            if key not in ids:
+                ids[key] = len(self.keys)
+                self.keys.append(key)
+            return ids[key]
+
+        # start distribution: the agent on the empty board, or the teacher
+        start = {agentState('-'*N_CELLS): 0.5}
+        for cell, p in teacherDistribution(teacher, '-'*N_CELLS).items():
+            i = agentState(_place('-'*N_CELLS, cell, 'X'))
+            start[i] = start.get(i, 0.) + 0.5*p
+
+        win, draw, loss = {}, {}, {}
+        pairs, nexts, probs = [], [], []
+        i = 0
+        while i < len(self.keys):
+            key = self.keys[i]
+            for a in legalActions(key):
+                pair = i*N_CELLS + a[0]*3 + a[1]
+                s1 = _place(key, a[0]*3 + a[1], 'O')
+                result = gameResult(s1)
+                if result is not None:
+                    (win if result == 'O' else draw)[pair] = 1.
+                    continue
+                for cell, p in teacherDistribution(teacher, s1).items():
+                    s2 = _place(s1, cell, 'X')
+                    result = gameResult(s2)
+                    if result == 'X':
+                        loss[pair] = loss.get(pair, 0.) + p
+                    elif result == '-':
+                        draw[pair] = draw.get(pair, 0.) + p
+                    else:
+                        pairs.append(pair)
+                        nexts.append(agentState(s2))
+                        probs.append(p)
+            i += 1
+
+        n = len(self.keys)
+
+        def dense(d):
+            out = np.zeros(n*N_CELLS)
+            out[list(d.keys())] = list(d.values())
+            return out.reshape(n, N_CELLS)
+
+        self.legal = np.zeros((n, N_CELLS), dtype=bool)
+        for i, key in enumerate(self.keys):
+            self.legal[i] = [c == '-' for c in key]
+        self.outcomes = {'win': dense(win), 'draw': dense(draw),
+                         'loss': dense(loss)}
+        self.reward = self.outcomes['win'] - self.outcomes['loss']
+        self.start = np.zeros(n)
+        self.start[list(start.keys())] = list(start.values())
+        self.pairs = np.array(pairs, dtype=np.int64)
+        self.nexts = np.array(nexts, dtype=np.int64)
+        self.probs = np.array(probs)
+        self.codes = np.array([encodeState(key) for key in self.keys],
+                              dtype=np.int64)
+
+    def greedyValues(self, Q):
+        """ State values of the (epsilon-)greedy policy on Q. """
+        masked = np.where(self.legal, Q, -np.inf)
+        best = masked.max(axis=1)
+        if self.eps == 0.:
+            return best
+        mean = np.where(self.legal, Q, 0.).sum(axis=1)/self.legal.sum(axis=1)
+        return (1. - self.eps)*best + self.eps*mean
+
+    def iterate(self, reward, values, gamma=None, max_sweeps=100):
+        """
+        Iterate Q = reward + gamma * E[values(Q) of the next state] to its
+        fixed point, starting from Q = 0.
+
+        Parameters
+        ----------
+        reward : (n, 9) array
+            expected immediate reward of each state-action pair
+        values : callable
+            maps an (n, 9) Q array onto the (n,) state values
+        gamma : float
+            discounting rate. Defaults to the solution's gamma
+        """
+        gamma = self.gamma if gamma is None else gamma
+        Q = np.zeros_like(reward)
+        for _ in range(max_sweeps):
+            V = values(Q)
+            backup = np.bincount(self.pairs, weights=self.probs*V[self.nexts],
+                                 minlength=reward.size)
+            Q_new = reward + gamma*backup.reshape(reward.shape)
+            if np.array_equal(Q_new, Q):
+                break
+            Q = Q_new
+        return Q
+
+    def policyValues(self, policy):
+        """ Return a values function for a fixed (n, 9) action distribution. """
+        return lambda Q: (policy*Q).sum(axis=1)
+
+    def greedyPolicy(self, Q):
+        """
+        Return the (n, 9) action distribution of the greedy policy on Q,
+        breaking ties uniformly at random as Learner.get_action does.
+        """
+        masked = np.where(self.legal, Q, -np.inf)
+        best = masked == masked.max(axis=1, keepdims=True)
+        return best/best.sum(axis=1, keepdims=True)
+
+    def evaluate(self, policy):
+        """
+        Evaluate a fixed (n, 9) action distribution of the agent. Returns a
+        dict with the expected discounted return from the start of a game
+        and the probabilities of a win, a draw and a loss.
+        """
+        values = self.policyValues(policy)
+        Q = self.iterate(self.reward, values)
+        report = {'value': float(self.start @ values(Q))}
+        for name, reward in self.outcomes.items():
+            Q = self.iterate(reward, values, gamma=1.)
+            report[name] = float(self.start @ values(Q))
+        return report
+
+    def occupancy(self, policy):
+        """
+        Expected number of visits to each state in one game when the agent
+        follows a fixed (n, 9) action distribution.
+        """
+        taken = policy.reshape(-1)[self.pairs]*self.probs
+        rows = self.pairs//N_CELLS
+        d = self.start
+        for _ in range(N_CELLS + 1):
+            d_new = self.start + np.bincount(self.nexts, weights=taken*d[rows],
+                                             minlength=len(d))
+            if np.array_equal(d_new, d):
+                break
+            d = d_new
+        return d
+
+    def agentValues(self, agent):
+        """ Return the agent's Q values on the solution's states. """
+        return denseValues(agent.Q)[self.codes]
+
+    def makeAgent(self, learner=Qlearner, alpha=0.5, eps=0.1, **kwargs):
+        """
+        Create a learner whose Q values are the solution's. Extra keyword
+        arguments (e.g. backend) are passed to the learner.
+
+        Parameters
+        ----------
+        learner : class
+            Qlearner or SARSAlearner
+        alpha : float
+            learning rate, for further training
+        eps : float
+            the agent's exploration rate
+        """
+        agent = learner(alpha, self.gamma, eps, **kwargs)
+        Q = np.where(self.legal, self.Q, 0.)
+        if isinstance(agent.Q, DenseQTable):
+            agent.Q.array[self.codes] = Q
+        else:
+            for key, row, legal in zip(self.keys, Q, self.legal):
+                for cell in np.flatnonzero(legal):
+                    agent.Q.add(key, divmod(int(cell), 3), row[cell])
+        return agent
+
+    def optimalityGap(self, agent):
+        """
+        Compare the greedy policy of a trained agent with the optimal one.
+
+        Returns a dict with the exact evaluation of both policies (see
+        evaluate), the gap in expected return, the fraction of the states
+        the agent visits in which it may pick a suboptimal move, the
+        expected number of suboptimal moves per game, and the mean and
+        maximum absolute error of the agent's Q values.
+        """
+        Q = self.agentValues(agent)
+        policy = self.greedyPolicy(Q)
+        optimal = self.greedyPolicy(self.Q)
+        best = np.where(self.legal, self.Q, -np.inf).max(axis=1, keepdims=True)
+        # a move is suboptimal if it loses value (beyond rounding)
+        worse = np.where(self.Q < best - 1e-9, policy, 0.).sum(axis=1)
+        visits = self.occupancy(policy)
+        error = np.abs(Q - self.Q)[self.legal]
+        agent_report = self.evaluate(policy)
+        optimal_report = self.evaluate(optimal)
+        return {
+            'optimal': optimal_report,
+            'agent': agent_report,
+            'gap': optimal_report['value'] - agent_report['value'],
+            'suboptimal_states': float((worse[visits > 0] > 0).mean()),
+            'suboptimal_moves': float(visits @ worse),
+            'q_error_mean': float(error.mean()),
+            'q_error_max': float(error.max()),
+        }
@@ -0,0 +1,189 @@
+import os
+
+from tictactoe.files import atomicOpen
+from tictactoe.qtable import N_CELLS, decodeState, encodeState
+
+
+# Flat cell indices of the 8 lines that win the game.
+LINES = ((0, 1, 2), (3, 4, 5), (6, 7, 8),
+         (0, 3, 6), (1, 4, 7), (2, 5, 8),
+         (0, 4, 8), (2, 4, 6))
+
+# Tokens in the order of their base-3 digit (see qtable.encodeState). The
+# 'winner' of a position uses the same digits: 0 for none, 1 for 'O' and 2
+# for 'X'.
+TOKENS = '-OX'
+
+# Version of the cache file layout; bump it when the index changes.
+CACHE_VERSION = 2
+CACHE_DIR = os.environ.get(
+    'TICTACTOE_CACHE', os.path.join(os.path.expanduser('~'), '.cache', 'tictactoe'))
+
+_INDEX = None
+
+# MASK_ACTIONS[m] is the tuple of (i,j) cells whose bits are set in mask m
+MASK_ACTIONS = [tuple(divmod(p, 3) for p in range(N_CELLS) if m >> p & 1)
+                 for m in range(1 << N_CELLS)]
+
+
+def _winner(key):
+    """ Return the token holding a full line in 'key', or '-'. """
+    for a, b, c in LINES:
+        if key[a] != '-' and key[a] == key[b] == key[c]:
+            return key[a]
+    return '-'
+
+
+def enumerateStates():
+    """
+    Enumerate every position reachable from the empty board, with either
+    player moving first and play stopping at a win or a full board. Returns
+    the encoded states in increasing order.
+    """
+    # NumPy is only needed to build or load the index; import it on use
+    import numpy as np
+    seen = {'-'*N_CELLS}
+    frontier = ['-'*N_CELLS]
+    while frontier:
+        children = []
+        for key in frontier:
+            if _winner(key) != '-':
+                continue
+            n_o, n_x = key.count('O'), key.count('X')
+            movers = [t for t, n, m in (('O', n_o, n_x), ('X', n_x, n_o)) if n <= m]
+            for p in range(N_CELLS):
+                if key[p] != '-':
+                    continue
+                for token in movers:
+                    child = key[:p] + token + key[p+1:]
+                    if child not in seen:
+                        seen.add(child)
+                        children.append(child)
+        frontier = children
+    return np.array(sorted(encodeState(key) for key in seen), dtype=np.int64)
+
+
+class StateIndex:
+    """
+    Precomputed structure of the tic-tac-toe game tree. Every reachable
+    position gets a dense id (its rank by encoded state), and the following
+    are stored per id:
+
+    codes : int64 array
+        the encoded state (see qtable.encodeState)
+    legal : uint16 array
+        bitmask of the empty cells; bit k is set if cell k = row*3 + col
+        is empty
+    winner : int8 array
+        0 if nobody has won, 1 if 'O' has and 2 if 'X' has
+
+    Lookups by state string go through the 'ids' dict, and the lists
+    'keys' and 'actions' hold each position's string and tuple of legal
+    (i,j) actions for the pure-Python game loop. Use stateIndex() to get the
+    shared, cached instance.
+
+    Parameters
+    ----------
+    codes, legal, winner : arrays
+        the per-position arrays described above (see StateIndex.build)
+    """
+    def __init__(self, codes, legal, winner):
+        self.codes = codes
+        self.legal = legal
+        self.winner = winner
+        self.keys = [decodeState(c) for c in codes.tolist()]
+        self.ids = {key: i for i, key in enumerate(self.keys)}
+        self.actions = [MASK_ACTIONS[m] for m in legal.tolist()]
+        # result of each position: the winning token, '-' for a draw and
+        # None while the game goes on
+        self.results = [TOKENS[w] if w else ('-' if not m else None)
+                        for w, m in zip(winner.tolist(), legal.tolist())]
+
+    @classmethod
+    def build(cls):
+        """ Enumerate the game tree and compute the index from scratch. """
+        import numpy as np
+        codes = enumerateStates()
+        keys = [decodeState(c) for c in codes.tolist()]
+        n = len(codes)
+        legal = np.zeros(n, dtype=np.uint16)
+        winner = np.zeros(n, dtype=np.int8)
+        for i, key in enumerate(keys):
+            winner[i] = TOKENS.index(_winner(key))
+            for p in range(N_CELLS):
+                if key[p] == '-':
+                    legal[i] |= 1 << p
+        return cls(codes, legal, winner)
+
+    def __len__(self):
+        return len(self.codes)
+
+    def legalActions(self, s):
+        """
+        Return the tuple of legal (i,j) actions of state string 's', in
+        row-major order.
+        """
+        i = self.ids.get(s)
+        if i is None:
+            return tuple(divmod(p, 3) for p in range(N_CELLS) if s[p] == '-')
+        return self.actions[i]
+
+    def result(self, s):
+        """
+        Return the winning token of state string 's', '-' for a draw, or
+        None if the game is not over.
+        """
+        i = self.ids.get(s)
+        if i is None:
+            w = _winner(s)
+            return w if w != '-' else ('-' if '-' not in s else None)
+        return self.results[i]
+
+
+def _cachePath(cache_dir):
+    return os.path.join(cache_dir, 'states-v%i.npz' % CACHE_VERSION)
+
+
+def stateIndex(cache_dir=None):
+    """
+    Return the shared StateIndex. It is built on first use and cached on
+    disk, so that later processes only load its arrays. If the cache cannot
+    be read or written, the index is built in memory.
+
+    Parameters
+    ----------
+    cache_dir : string
+        directory of the cache file. Defaults to $TICTACTOE_CACHE or
+        ~/.cache/tictactoe
+    """
+    global _INDEX
+    if _INDEX is not None:
+        return _INDEX
+    import numpy as np
+    path = _cachePath(cache_dir or CACHE_DIR)
+    try:
+        with np.load(path) as data:
+            _INDEX = StateIndex(data['codes'], data['legal'], data['winner'])
+    except (OSError, ValueError, KeyError):
+        _INDEX = StateIndex.build()
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with atomicOpen(path) as f:
+                np.savez(f, codes=_INDEX.codes, legal=_INDEX.legal,
+                         winner=_INDEX.winner)
+        except OSError:
+            pass
+    return _INDEX
+
+
+def legalActions(s):
+    """ Return the tuple of legal (i,j) actions of state string 's'. """
+    return (_INDEX or stateIndex()).legalActions(s)
+
+
+def gameResult(s):
+    """
+    Return the winning token of state string 's', '-' for a draw, or None
+    if the game is not over.
+    """
+    return (_INDEX or stateIndex()).result(s)
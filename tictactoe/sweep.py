@@ -0,0 +1,165 @@
+import csv
+import functools
+import itertools
+import multiprocessing as mp
+import os
+
+from tictactoe.agent import Qlearner, SARSAlearner
+from tictactoe.evaluate import GreedyAgent, playMatch
+from tictactoe.game import Game
+from tictactoe.players import TeacherPlayer
+from tictactoe.rng import makeStream, spawnSeeds
+from tictactoe.teacher import Teacher
+
+
+# Swept hyperparameters, in the order of the learner's arguments
+PARAMETERS = ('agent_type', 'alpha', 'gamma', 'epsilon', 'eps_decay')
+DEFAULTS = {'agent_type': 'q', 'alpha': 0.5, 'gamma': 0.9, 'epsilon': 0.1,
+            'eps_decay': 0.}
+
+
+def gridTrials(space):
+    """
+    Return every combination of the values in a search space, a dict of
+    parameter name -> list of values. Parameters that are not given take
+    their default values.
+    """
+    names = list(space)
+    return [dict(DEFAULTS, **dict(zip(names, values)))
+            for values in itertools.product(*(space[name] for name in names))]
+
+
+def randomTrials(space, n, seed=None):
+    """
+    Draw n random trials from a search space, a dict of parameter name ->
+    either a list of values (one is picked uniformly) or a (low, high)
+    tuple (a value is drawn uniformly from the range).
+    """
+    rng = makeStream(seed)
+    trials = []
+    for _ in range(n):
+        trial = dict(DEFAULTS)
+        for name, values in space.items():
+            if isinstance(values, tuple):
+                low, high = values
+                trial[name] = low + (high - low)*rng.random()
+            else:
+                trial[name] = rng.choice(values)
+        trials.append(trial)
+    return trials
+
+
+def runTrial(task, episodes, eval_every, eval_games, teacher_level, patience,
+             min_delta):
+    """
+    Train one agent against the teacher, evaluating its greedy play every
+    'eval_every' episodes. Training stops early once the win rate has not
+    improved by more than 'min_delta' for 'patience' evaluations in a row.
+    Returns the trial's parameters with its results.
+    """
+    trial, seed = task
+    agent_rng, teacher_rng, eval_rng = makeStream(seed).spawn(3)
+    learner = Qlearner if trial['agent_type'] == 'q' else SARSAlearner
+    agent = learner(trial['alpha'], trial['gamma'], trial['epsilon'],
+                    trial['eps_decay'], backend='dense', rng=agent_rng)
+    player = TeacherPlayer(Teacher(teacher_level, teacher_rng))
+    judge = TeacherPlayer(Teacher(teacher_level, eval_rng))
+    history = []
+    best, stale = None, 0
+    played = 0
+    while played < episodes:
+        n = min(eval_every, episodes - played)
+        for _ in range(n):
+            Game(agent, player=player).start()
+        played += n
+        counts = playMatch(GreedyAgent(agent, eval_rng), judge, eval_games)
+        rates = {'win': counts[1]/eval_games, 'draw': counts[0]/eval_games,
+                 'loss': counts[-1]/eval_games}
+        history.append((played, rates))
+        if best is None or rates['win'] > best[1]['win'] + min_delta:
+            best, stale = (played, rates), 0
+        else:
+            stale += 1
+            if stale >= patience:
+                break
+    result = dict(trial)
+    result.update(episodes=played, stopped_early=played < episodes,
+                  best_episodes=best[0], win=best[1]['win'],
+                  draw=best[1]['draw'], loss=best[1]['loss'],
+                  history=history)
+    return result
+
+
+def runSweep(trials, episodes=100000, eval_every=5000, eval_games=1000,
+             teacher_level=0.9, patience=3, min_delta=0.005, workers=None,
+             seed=None, progress=None):
+    """
+    Run trials concurrently on a process pool. Each trial gets its own seed
+    derived from 'seed', so results do not depend on the number of workers.
+
+    Parameters
+    ----------
+    trials : list of dicts
+        hyperparameters of each trial (see gridTrials and randomTrials)
+    episodes : int
+        maximum training episodes per trial
+    eval_every : int
+        training episodes between evaluations
+    eval_games : int
+        greedy games against the teacher per evaluation
+    teacher_level : float
+        ability level of the teacher, in training and evaluation
+    patience : int
+        evaluations without improvement before a trial is stopped
+    min_delta : float
+        smallest increase of the win rate that counts as an improvement
+    workers : int
+        number of worker processes. Defaults to the number of CPUs
+    seed : int
+        seed from which the trial seeds are derived
+    progress : callable
+        if given, called with each result as its trial finishes
+
+    Returns the results of all trials, best win rate first.
+    """
+    run = functools.partial(runTrial, episodes=episodes, eval_every=eval_every,
+                            eval_games=eval_games, teacher_level=teacher_level,
+                            patience=patience, min_delta=min_delta)
+    tasks = list(zip(trials, spawnSeeds(seed, len(trials))))
+    ctx = mp.get_context('fork' if 'fork' in mp.get_all_start_methods()
+                         else None)
+    results = []
+    with ctx.Pool(workers or os.cpu_count() or 1) as pool:
+        for result in pool.imap_unordered(run, tasks):
+            results.append(result)
+            if progress is not None:
+                progress(result)
+    # ties are ordered by trial parameters, not by completion order
+    results.sort(key=lambda r: (-r['win'], r['loss'],
+                                tuple(r[name] for name in PARAMETERS)))
+    return results
+
+
+# Columns of the results table
+COLUMNS = PARAMETERS + ('episodes', 'best_episodes', 'stopped_early', 'win',
+                        'draw', 'loss')
+
+
+def formatResults(results):
+    """ Format sweep results as a text table. """
+    lines = ['%-5s %7s %7s %7s %9s %9s %9s %5s %6s %6s %s'
+             % ('agent', 'alpha', 'gamma', 'eps', 'decay', 'episodes',
+                'best at', 'early', 'win', 'draw', 'loss')]
+    for r in results:
+        lines.append('%-5s %7.4g %7.4g %7.4g %9.3g %9i %9i %5s %6.3f %6.3f %.3f'
+                     % tuple(r[c] for c in COLUMNS))
+    return '\n'.join(lines)
+
+
+def writeResults(results, path):
+    """ Write sweep results, one row per trial, to a CSV file. """
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(COLUMNS)
+        for r in results:
+            writer.writerow([r[c] for c in COLUMNS])
@@ -0,0 +1,113 @@
+from tictactoe.qtable import QTable
+
+
+def _permutation(transform):
+    """ Flat-index permutation for a function mapping (i,j) -> (i',j'). """
+    perm = [0]*9
+    for i in range(3):
+        for j in range(3):
+            ti, tj = transform(i, j)
+            perm[ti*3 + tj] = i*3 + j
+    return tuple(perm)
+
+
+# The 8 symmetries of the square (dihedral group D4). For each permutation
+# g, the transformed board is given by new[p] = old[g[p]].
+TRANSFORMS = tuple(_permutation(f) for f in (
+    lambda i, j: (i, j),          # identity
+    lambda i, j: (j, 2-i),        # rotate 90
+    lambda i, j: (2-i, 2-j),      # rotate 180
+    lambda i, j: (2-j, i),        # rotate 270
+    lambda i, j: (i, 2-j),        # mirror left-right
+    lambda i, j: (2-i, j),        # mirror top-bottom
+    lambda i, j: (j, i),          # transpose
+    lambda i, j: (2-j, 2-i),      # anti-transpose
+))
+
+# ACTION_MAPS[t][k] is the (i,j) position that cell k of the original board
+# moves to under transform t.
+ACTION_MAPS = tuple(tuple(divmod(g.index(k), 3) for k in range(9))
+                    for g in TRANSFORMS)
+
+_CANONICAL = {}
+
+
+def canonicalize(s):
+    """
+    Map a state string onto its canonical representative, the smallest of
+    its 8 symmetric variants. Returns the canonical state and the index of
+    the transform that produces it. Results are cached.
+
+    Parameters
+    ----------
+    s : string
+        state
+    """
+    result = _CANONICAL.get(s)
+    if result is None:
+        result = min((''.join([s[p] for p in g]), t)
+                     for t, g in enumerate(TRANSFORMS))
+        _CANONICAL[s] = result
+    return result
+
+
+_ACTIONS = {}
+
+
+def canonicalActions(s):
+    """
+    Map a state string onto its canonical state (see canonicalize), and
+    each of its cells onto a canonical action. A canonical board may map
+    onto itself under some symmetries (e.g. the empty board under all 8);
+    cells that such a symmetry swaps are equivalent moves, so each cell is
+    mapped to the smallest cell of its orbit. Returns the canonical state
+    and a tuple holding the canonical (i,j) action of each flat cell of s.
+    Results are cached.
+
+    Parameters
+    ----------
+    s : string
+        state
+    """
+    result = _ACTIONS.get(s)
+    if result is None:
+        c, t = canonicalize(s)
+        stabilizer = [u for u, g in enumerate(TRANSFORMS)
+                      if ''.join([c[p] for p in g]) == c]
+        cells = []
+        for i, j in ACTION_MAPS[t]:
+            k = i*3 + j
+            cells.append(min(ACTION_MAPS[u][k] for u in stabilizer))
+        result = _ACTIONS[s] = (c, tuple(cells))
+    return result
+
+
+class SymmetricQTable(QTable):
+    """
+    Stores Q values only for canonical states. States and actions are
+    transformed into canonical coordinates (see canonicalActions) before
+    the wrapped table is accessed, so all 8 symmetric variants of a board
+    share their values, and so do equivalent moves on a symmetric board.
+
+    Parameters
+    ----------
+    table : QTable
+        the table that holds the canonical Q values
+    """
+    def __init__(self, table):
+        self.table = table
+
+    def get(self, s, a):
+        c, m = canonicalActions(s)
+        return self.table.get(c, m[a[0]*3 + a[1]])
+
+    def values(self, s, actions):
+        c, m = canonicalActions(s)
+        return self.table.values(c, [m[a[0]*3 + a[1]] for a in actions])
+
+    def add(self, s, a, delta):
+        c, m = canonicalActions(s)
+        self.table.add(c, m[a[0]*3 + a[1]], delta)
+
+    def size(self):
+        return self.table.size()
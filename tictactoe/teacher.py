@@ -1,4 +1,6 @@
-import random
+from tictactoe.rng import makeStream
+from tictactoe.states import legalActions
+
 
 class Teacher:
     """ 
@@ -13,14 +15,19 @@ class Teacher:
     level : float 
         teacher ability level. This is a value between 0-1 that indicates the
         probability of making the optimal move at any given time.
+    rng : RandomStream, Generator or seed
+        source of the teacher's random numbers (see rng.makeStream)
     """
 
-    def __init__(self, level=0.9):
+    def __init__(self, level=0.9, rng=None):
         """
         Ability level determines the probability that the teacher will follow
         the optimal strategy as opposed to choosing a random available move.
         """
         self.ability_level = level
+        self.rng = makeStream(rng)
+        # optimal moves found so far, keyed by state string
+        self.moves = {}
 
     def win(self, board, key='X'):
         """ If we have two in a row and the 3rd is available, take it. """
@@ -171,12 +178,8 @@ class Teacher:
 
     def randomMove(self, board):
         """ Chose a random move from the available options. """
-        possibles = []
-        for i in range(3):
-            for j in range(3):
-                if board[i][j] == '-':
-                    possibles += [(i, j)]
-        return possibles[random.randint(0, len(possibles)-1)]
+        possibles = legalActions(''.join(board[0] + board[1] + board[2]))
+        return possibles[self.rng.randint(0, len(possibles)-1)]
 
     def makeMove(self, board):
         """
@@ -185,9 +188,21 @@ class Teacher:
         (row, col).
         """
         # Chose randomly with some probability so that the teacher does not always win
-        if random.random() > self.ability_level:
+        if self.rng.random() > self.ability_level:
             return self.randomMove(board)
-        # Follow optimal strategy
+        # Follow optimal strategy. The hierarchy is deterministic, so each
+        # state's move is only worked out once.
+        key = ''.join(board[0] + board[1] + board[2])
+        move = self.moves.get(key)
+        if move is None:
+            move = self.moves[key] = self.optimalMove(board)
+        return move
+
+    def optimalMove(self, board):
+        """
+        Return the move picked by the hierarchy of strategies, ignoring
+        the ability level.
+        """
         a = self.win(board)
         if a is not None:
             return a
@@ -209,4 +224,102 @@ class Teacher:
         a = self.sideEmpty(board)
         if a is not None:
             return a
-        return self.randomMove(board)
\ No newline at end of file
+        return self.randomMove(board)
+
+# Flat cell indices of the 8 lines that win the game.
+LINES = ((0, 1, 2), (3, 4, 5), (6, 7, 8),
+         (0, 3, 6), (1, 4, 7), (2, 5, 8),
+         (0, 4, 8), (2, 4, 6))
+
+# Optimal moves for 'X', keyed by state string. Filled by solveGame().
+_OPTIMAL_MOVES = {}
+
+
+def _hasWon(key, token):
+    """ Check whether 'token' holds a full line in state string 'key'. """
+    for a, b, c in LINES:
+        if key[a] == token and key[b] == token and key[c] == token:
+            return True
+    return False
+
+
+def solveGame():
+    """
+    Solve tic-tac-toe with memoized negamax over every position reachable
+    from the empty board (with either player moving first). Returns a dict
+    that maps each state string where 'X' is to move onto the tuple of
+    optimal (row, col) moves. Faster wins and slower losses are preferred.
+    The result is computed once and cached.
+    """
+    if _OPTIMAL_MOVES:
+        return _OPTIMAL_MOVES
+    scores = {}
+
+    def negamax(key, player):
+        # score of the position for the player to move
+        if (key, player) in scores:
+            return scores[key, player]
+        other = 'O' if player == 'X' else 'X'
+        empties = [p for p in range(9) if key[p] == '-']
+        values = []
+        for p in empties:
+            child = key[:p] + player + key[p+1:]
+            if _hasWon(child, player):
+                values.append(len(empties))
+            elif len(empties) == 1:
+                values.append(0)
+            else:
+                values.append(-negamax(child, other))
+        best = max(values)
+        scores[key, player] = best
+        if player == 'X':
+            _OPTIMAL_MOVES[key] = tuple(divmod(p, 3) for p, v in zip(empties, values)
+                                        if v == best)
+        return best
+
+    negamax('-'*9, 'X')
+    negamax('-'*9, 'O')
+    return _OPTIMAL_MOVES
+
+
+class PerfectTeacher(Teacher):
+    """
+    A teacher that plays perfectly, by looking up its move in the solved
+    game table (see solveGame). The table is built on first use.
+
+    Parameters
+    ----------
+    level : float
+        teacher ability level. This is a value between 0-1 that indicates the
+        probability of making the optimal move at any given time.
+    random_ties : bool
+        whether to choose randomly among equally good optimal moves. If
+        False, the first optimal move is always played.
+    rng : RandomStream, Generator or seed
+        source of the teacher's random numbers (see rng.makeStream)
+    """
+    def __init__(self, level=0.9, random_ties=True, rng=None):
+        super().__init__(level, rng)
+        self.random_ties = random_ties
+        self.table = solveGame()
+
+    def optimalMoves(self, board):
+        """ Return the tuple of all optimal moves for the current board. """
+        return self.table[''.join(board[0] + board[1] + board[2])]
+
+    def optimalMove(self, board):
+        """ Return the first of the optimal moves for the current board. """
+        return self.optimalMoves(board)[0]
+
+    def makeMove(self, board):
+        """
+        Look up the best move for the current board, with random play at the
+        rate set by the ability level. A touple is returned that represents
+        (row, col).
+        """
+        if self.rng.random() > self.ability_level:
+            return self.randomMove(board)
+        moves = self.optimalMoves(board)
+        if self.random_ties and len(moves) > 1:
+            return moves[self.rng.randint(0, len(moves)-1)]
+        return moves[0]